@@ -1,8 +1,18 @@
 import json
+import math
 import numpy as np
 from typing import Dict, Any, Union, Tuple
 
 
+def analyses_key(patient: Dict[str, Any]) -> str:
+    """Строковый ключ набора анализов пациента для сравнения дубликатов"""
+    # Сортируем анализы для консистентного сравнения
+    return json.dumps(
+        {k: v for k, v in sorted(patient.get('analyses', {}).items())},
+        sort_keys=True
+    )
+
+
 def remove_empty_and_duplicates(data: Union[Dict[str, Any], str]) -> Tuple[Dict[str, Any], Dict[str, int]]:
     """
     Удаляет пустые записи и дубликаты из JSON данных.
@@ -46,7 +56,8 @@ def remove_empty_and_duplicates(data: Union[Dict[str, Any], str]) -> Tuple[Dict[
             if 'value' in analysis:
                 try:
                     value = float(analysis['value'])
-                    if not np.isnan(value) and np.isfinite(value):
+                    # math.isfinite на float быстрее np.isnan/np.isfinite (без numpy-скаляров)
+                    if math.isfinite(value):
                         has_valid_analysis = True
                         break
                 except (ValueError, TypeError):
@@ -58,25 +69,31 @@ def remove_empty_and_duplicates(data: Union[Dict[str, Any], str]) -> Tuple[Dict[
             stats['removed_empty'] += 1
     
     # Шаг 2: Удаление дубликатов
-    # Дубликат = одинаковые patient_id, date и все анализы
-    seen = set()
+    # Дубликат = одинаковые patient_id, date и все анализы.
+    # Ключ анализов (сериализация в JSON) строим только для записей, у которых
+    # patient_id и date уже встречались - у большинства записей они уникальны
+    first_by_prefix = {}  # "patient_id|date" -> первая запись с такими patient_id и date
+    seen_analyses = {}  # "patient_id|date" -> ключи анализов уже оставленных записей
     unique_patients = []
     
     for patient in valid_patients:
         # Создаем ключ для проверки дубликатов
         patient_id = patient.get('patient_id', '')
         date = patient.get('date', '')
+        prefix = f"{patient_id}|{date}"
         
-        # Сортируем анализы для консистентного сравнения
-        analyses_key = json.dumps(
-            {k: v for k, v in sorted(patient.get('analyses', {}).items())},
-            sort_keys=True
-        )
+        if prefix not in first_by_prefix:
+            first_by_prefix[prefix] = patient
+            unique_patients.append(patient)
+            continue
         
-        duplicate_key = f"{patient_id}|{date}|{analyses_key}"
+        keys = seen_analyses.get(prefix)
+        if keys is None:
+            keys = seen_analyses[prefix] = {analyses_key(first_by_prefix[prefix])}
         
-        if duplicate_key not in seen:
-            seen.add(duplicate_key)
+        key = analyses_key(patient)
+        if key not in keys:
+            keys.add(key)
             unique_patients.append(patient)
         else:
             stats['removed_duplicates'] += 1
@@ -127,7 +144,7 @@ def remove_outliers_3sigma(data: Union[Dict[str, Any], str]) -> Tuple[Dict[str,
             
             try:
                 value = float(analysis['value'])
-                if np.isnan(value) or not np.isfinite(value):
+                if not math.isfinite(value):
                     continue
                 
                 if test_id not in test_values:
@@ -140,7 +157,8 @@ def remove_outliers_3sigma(data: Union[Dict[str, Any], str]) -> Tuple[Dict[str,
                 continue
     
     # Вычисляем границы для каждого теста по правилу трех сигм
-    test_bounds = {}  # {test_id: (lower_bound, upper_bound)}
+    # и помечаем выбросы векторно - сравнением всего массива значений теста с границами
+    outliers_by_patient = {}  # {patient_idx: [test_id, ...]} - анализы для удаления
     
     for test_id, values in test_values.items():
         if len(values) < 2:  # Нужно минимум 2 значения для вычисления σ
@@ -153,54 +171,38 @@ def remove_outliers_3sigma(data: Union[Dict[str, Any], str]) -> Tuple[Dict[str,
         if std == 0:  # Если все значения одинаковые, нет выбросов
             continue
         
-        lower_bound = mean - 3 * std
-        upper_bound = mean + 3 * std
+        lower = mean - 3 * std
+        upper = mean + 3 * std
         
-        test_bounds[test_id] = (lower_bound, upper_bound)
-    
-    # Помечаем выбросы
-    outliers_to_remove = set()  # Множество (patient_idx, test_id) для удаления
-    
-    for test_id, bounds in test_bounds.items():
-        lower, upper = bounds
-        outlier_count = 0
+        outlier_positions = np.flatnonzero((values_array < lower) | (values_array > upper))
+        if len(outlier_positions) == 0:
+            continue
         
-        for idx, patient_idx in enumerate(patient_indices[test_id]):
-            value = test_values[test_id][idx]
-            
-            if value < lower or value > upper:
-                outliers_to_remove.add((patient_idx, test_id))
-                outlier_count += 1
+        indices = patient_indices[test_id]
+        for position in outlier_positions.tolist():
+            outliers_by_patient.setdefault(indices[position], []).append(test_id)
         
-        if outlier_count > 0:
-            stats['outliers_by_test'][test_id] = {
-                'count': outlier_count,
-                'bounds': {'lower': float(lower), 'upper': float(upper)},
-                'mean': float(np.mean(test_values[test_id])),
-                'std': float(np.std(test_values[test_id]))
-            }
+        stats['outliers_by_test'][test_id] = {
+            'count': len(outlier_positions),
+            'bounds': {'lower': float(lower), 'upper': float(upper)},
+            'mean': float(mean),
+            'std': float(std)
+        }
     
-    stats['total_outliers'] = len(outliers_to_remove)
+    # Каждый анализ пациента встречается в тесте один раз, поэтому пары (пациент, тест) уникальны
+    stats['total_outliers'] = sum(len(test_ids) for test_ids in outliers_by_patient.values())
     
-    # Удаляем выбросы из анализов пациентов
-    patients_to_remove = set()
+    # Удаляем выбросы из анализов пациентов (только у пациентов, где они есть)
+    for patient_idx, test_ids in outliers_by_patient.items():
+        analyses = result['patients'][patient_idx]['analyses']
+        for test_id in test_ids:
+            del analyses[test_id]
     
-    for patient_idx, patient in enumerate(result['patients']):
-        if 'analyses' not in patient:
-            continue
-        
-        analyses_to_remove = []
-        for test_id in patient['analyses'].keys():
-            if (patient_idx, test_id) in outliers_to_remove:
-                analyses_to_remove.append(test_id)
-        
-        # Удаляем выбросы из анализов
-        for test_id in analyses_to_remove:
-            del patient['analyses'][test_id]
-        
-        # Если у пациента не осталось анализов, помечаем для удаления
-        if not patient.get('analyses'):
-            patients_to_remove.add(patient_idx)
+    # Если у пациента не осталось анализов, помечаем для удаления
+    patients_to_remove = {
+        patient_idx for patient_idx, patient in enumerate(result['patients'])
+        if 'analyses' in patient and not patient['analyses']
+    }
     
     # Удаляем пациентов без анализов
     if patients_to_remove:
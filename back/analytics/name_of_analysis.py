@@ -1,5 +1,6 @@
 import json
 import re
+from functools import lru_cache
 from typing import Dict, Any, Union, Tuple, List, Optional
 from pathlib import Path
 
@@ -44,6 +45,7 @@ def transliterate_cyrillic_to_latin(text: str) -> str:
     return ''.join(result)
 
 
+@lru_cache(maxsize=4096, typed=True)
 def normalize_column_name(name: str) -> str:
     """
     Нормализует название столбца:
@@ -59,6 +61,9 @@ def normalize_column_name(name: str) -> str:
     
     Returns:
         Нормализованное название
+    
+    Результат кэшируется: одни и те же названия нормализуются при каждом сравнении
+    и при каждой загрузке таблицы.
     """
     if not isinstance(name, str):
         name = str(name)
@@ -87,6 +92,33 @@ def normalize_column_name(name: str) -> str:
     return normalized
 
 
+@lru_cache(maxsize=4096)
+def name_similarity(first: str, second: str, use_token_set: bool = False) -> float:
+    """
+    Схожесть двух названий через rapidfuzz (0-1): максимум из ratio, partial_ratio,
+    token_sort_ratio и, если use_token_set, token_set_ratio.
+    
+    Кэшируется по паре названий: при загрузке таблиц одни и те же названия колонок
+    сравниваются с одними и теми же названиями из справочника.
+    
+    Args:
+        first: Первое название
+        second: Второе название
+        use_token_set: Учитывать ли token_set_ratio
+    
+    Returns:
+        Схожесть от 0 до 1
+    """
+    score = max(
+        fuzz.ratio(first, second),
+        fuzz.partial_ratio(first, second),
+        fuzz.token_sort_ratio(first, second)
+    )
+    if use_token_set:
+        score = max(score, fuzz.token_set_ratio(first, second))
+    return score / 100.0
+
+
 def cluster_similar_names(
     names: List[str],
     similarity_threshold: float = 0.85
@@ -134,11 +166,7 @@ def cluster_similar_names(
             other_normalized = normalized_map[other_name]
             
             # Используем rapidfuzz для сравнения
-            similarity = max(
-                fuzz.ratio(normalized, other_normalized) / 100.0,
-                fuzz.partial_ratio(normalized, other_normalized) / 100.0,
-                fuzz.token_sort_ratio(normalized, other_normalized) / 100.0
-            )
+            similarity = name_similarity(normalized, other_normalized)
             
             if similarity >= similarity_threshold:
                 cluster_members.append(other_name)
@@ -205,21 +233,13 @@ def create_test_mapping(
                 excel_norm = excel_normalized[excel_id]
                 
                 # Сравниваем нормализованные ID
-                score1 = max(
-                    fuzz.ratio(json_norm, excel_norm) / 100.0,
-                    fuzz.partial_ratio(json_norm, excel_norm) / 100.0,
-                    fuzz.token_sort_ratio(json_norm, excel_norm) / 100.0
-                ) if RAPIDFUZZ_AVAILABLE else 0.0
+                score1 = name_similarity(json_norm, excel_norm) if RAPIDFUZZ_AVAILABLE else 0.0
                 
                 # Если есть название теста, сравниваем и с ним
                 if excel_id in excel_test_names:
                     excel_name = excel_test_names[excel_id]
                     excel_name_norm = normalize_column_name(excel_name)
-                    score2 = max(
-                        fuzz.ratio(json_norm, excel_name_norm) / 100.0,
-                        fuzz.partial_ratio(json_norm, excel_name_norm) / 100.0,
-                        fuzz.token_sort_ratio(json_norm, excel_name_norm) / 100.0
-                    ) if RAPIDFUZZ_AVAILABLE else 0.0
+                    score2 = name_similarity(json_norm, excel_name_norm) if RAPIDFUZZ_AVAILABLE else 0.0
                     score = max(score1, score2)
                 else:
                     score = score1
@@ -244,11 +264,7 @@ def create_test_mapping(
                 excel_norm = excel_normalized[excel_id]
                 
                 if RAPIDFUZZ_AVAILABLE:
-                    score = max(
-                        fuzz.ratio(json_norm, excel_norm) / 100.0,
-                        fuzz.partial_ratio(json_norm, excel_norm) / 100.0,
-                        fuzz.token_sort_ratio(json_norm, excel_norm) / 100.0
-                    )
+                    score = name_similarity(json_norm, excel_norm)
                 else:
                     score = 1.0 if json_norm == excel_norm else 0.0
                 
@@ -409,6 +425,7 @@ def process_json(data: Union[Dict[str, Any], str], json_path: str = None, simila
             # 5. Если не нашли, используем fuzzy matching с названиями из Excel
             if not found_excel_id and RAPIDFUZZ_AVAILABLE:
                 test_id_normalized = normalize_column_name(test_id)
+                test_id_lower = test_id.lower()
                 best_match = None
                 best_score = 0.0
                 
@@ -416,19 +433,10 @@ def process_json(data: Union[Dict[str, Any], str], json_path: str = None, simila
                     excel_name_normalized = normalize_column_name(excel_name)
                     
                     # Сравниваем нормализованные названия
-                    score = max(
-                        fuzz.ratio(test_id_normalized, excel_name_normalized) / 100.0,
-                        fuzz.partial_ratio(test_id_normalized, excel_name_normalized) / 100.0,
-                        fuzz.token_sort_ratio(test_id_normalized, excel_name_normalized) / 100.0,
-                        fuzz.token_set_ratio(test_id_normalized, excel_name_normalized) / 100.0
-                    )
+                    score = name_similarity(test_id_normalized, excel_name_normalized, use_token_set=True)
                     
                     # Также сравниваем с оригинальными названиями
-                    score2 = max(
-                        fuzz.ratio(test_id.lower(), excel_name.lower()) / 100.0,
-                        fuzz.partial_ratio(test_id.lower(), excel_name.lower()) / 100.0,
-                        fuzz.token_sort_ratio(test_id.lower(), excel_name.lower()) / 100.0
-                    )
+                    score2 = name_similarity(test_id_lower, excel_name.lower())
                     
                     final_score = max(score, score2)
                     
@@ -485,12 +493,9 @@ def process_json(data: Union[Dict[str, Any], str], json_path: str = None, simila
             if excel_name is None and RAPIDFUZZ_AVAILABLE:
                 best_match = None
                 best_score = 0.0
+                col_name_lower = col_name.lower()
                 for excel_name_candidate, excel_id in excel_all_names:
-                    score = max(
-                        fuzz.ratio(col_name.lower(), excel_name_candidate.lower()) / 100.0,
-                        fuzz.partial_ratio(col_name.lower(), excel_name_candidate.lower()) / 100.0,
-                        fuzz.token_sort_ratio(col_name.lower(), excel_name_candidate.lower()) / 100.0
-                    )
+                    score = name_similarity(col_name_lower, excel_name_candidate.lower())
                     if score > best_score and score >= similarity_threshold:
                         best_score = score
                         best_match = excel_id
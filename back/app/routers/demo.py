@@ -1,20 +1,34 @@
 """
 Роутер для демо варианта.
 """
-from fastapi import APIRouter, HTTPException, status, UploadFile, File
-from fastapi.responses import FileResponse
-from typing import Dict, Any, List
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Any, List, Optional, Tuple
+from functools import lru_cache
+import hashlib
 import logging
+import threading
+import time
 import json
+import os
+import pickle
 from pathlib import Path
-import csv
+import numpy as np
 import pandas as pd
-from datetime import datetime
-import shutil
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/demo", tags=["demo"])
+# Ответы демо-эндпоинтов - большие вложенные структуры (группы, графики), сериализуем через orjson
+router = APIRouter(prefix="/api/demo", tags=["demo"], default_response_class=ORJSONResponse)
 
 # Определяем базовую директорию приложения
 # В Docker контейнере рабочая директория /app, в локальной разработке - корень back/
@@ -37,11 +51,65 @@ DEMO_FILES = {
 MORE_PATIENTS_FILE = DATA_DIR / "more_patients.csv"
 # Путь к файлу test_table.csv с несколькими пациентами
 TEST_TABLE_FILE = DATA_DIR / "test_table.csv"
-# Путь к файлу с загруженными данными
+# Путь к файлу с загруженными данными (CSV - формат без pyarrow и для ранее сохраненных данных).
+# После переноса в Parquet (первая загрузка с pyarrow) CSV не удаляется, но больше не читается
 UPLOADED_DATA_FILE = DATA_DIR / "uploaded_data.csv"
+# При наличии pyarrow загруженные данные хранятся в Parquet: чтение без разбора текста и вывода типов.
+# Каждая загрузка - отдельная часть в UPLOADED_PARTS_DIR; манифест хранит список частей,
+# хэши ключей записей и число строк
+UPLOADED_PARTS_DIR = DATA_DIR / "uploaded_data_parts"
+UPLOADED_MANIFEST_FILE = DATA_DIR / "uploaded_data.manifest"
+# Единый Parquet файл прежней версии (переносится в части при первой загрузке)
+UPLOADED_PARQUET_FILE = DATA_DIR / "uploaded_data.parquet"
 # Путь по умолчанию (для обратной совместимости)
 TEST_TABLE_PATH = DEMO_FILES['1']
 
+# Схемы известных CSV: колонка -> dtype. Читаются только перечисленные колонки,
+# и pandas не тратит время на вывод типов. value читаем строкой - в демо-файлах
+# там встречаются даты; в число его переводит with_numeric_values.
+DEMO_TABLE_SCHEMA = {
+    'subjectGuid': 'string',
+    'date': 'string',
+    'test_short': 'string',
+    'value': 'string',
+    'original_column': 'string'
+}
+# Возможные названия колонок в test_table.csv (в порядке приоритета)
+PATIENT_ID_COLUMNS = ('subjectGuid', 'subject_guid', 'patient_id', 'patientId', 'id')
+DATE_COLUMNS = ('date', 'Date', 'DATE', 'draw_date', 'analysis_date')
+TEST_CODE_COLUMNS = ('test_code', 'original_column')
+TEST_NAME_COLUMNS = ('test_name', 'test_short')
+# test_table.csv может называть колонки по-разному, поэтому в схеме все известные варианты
+TEST_TABLE_SCHEMA = {
+    **{col: 'string' for col in PATIENT_ID_COLUMNS + DATE_COLUMNS + TEST_CODE_COLUMNS + TEST_NAME_COLUMNS},
+    'value': 'string',
+    'unit': 'string',
+    'status': 'string'
+}
+UPLOADED_DATA_SCHEMA = {
+    'patient_id': 'string',
+    'test_code': 'string',
+    'test_name': 'string',
+    'value': 'string',
+    'unit': 'string',
+    'date': 'string',
+    'status': 'string'
+}
+TABLE_SCHEMAS = {
+    DEMO_FILES['1']: DEMO_TABLE_SCHEMA,
+    DEMO_FILES['2']: DEMO_TABLE_SCHEMA,
+    MORE_PATIENTS_FILE: DEMO_TABLE_SCHEMA,
+    TEST_TABLE_FILE: TEST_TABLE_SCHEMA,
+    UPLOADED_DATA_FILE: UPLOADED_DATA_SCHEMA,
+    UPLOADED_PARQUET_FILE: UPLOADED_DATA_SCHEMA,
+    UPLOADED_MANIFEST_FILE: UPLOADED_DATA_SCHEMA
+}
+# Колонки с небольшим числом повторяющихся значений (ID пациентов, коды и названия тестов).
+# В кэше хранятся как category: значения - целочисленные коды, groupby/isin работают по ним
+CATEGORY_COLUMNS = frozenset(
+    PATIENT_ID_COLUMNS + TEST_CODE_COLUMNS + TEST_NAME_COLUMNS + ('unit', 'status')
+)
+
 # Путь к файлу с нормами
 # Сначала пробуем /app/analytics/data.json (Docker), потом back/analytics/data.json (локально)
 NORMS_PATH = ANALYTICS_DIR / "data.json"
@@ -65,6 +133,100 @@ logger.info(f"TEST_TABLE_FILE: {TEST_TABLE_FILE} (exists: {TEST_TABLE_FILE.exist
 logger.info(f"NORMS_PATH: {NORMS_PATH} (exists: {NORMS_PATH.exists()})")
 
 
+def read_csv_table(path: Path, schema: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """
+    Читает CSV в DataFrame.
+    Если установлен pyarrow, колонки хранятся в Arrow (строки - единым UTF-8 буфером,
+    а не Python-объектом на ячейку), и строковые операции выполняются в C++.
+    Если передана схема, читаются только ее колонки с заданными типами.
+    """
+    if schema and PYARROW_AVAILABLE:
+        return read_csv_arrow(path, schema)
+    kwargs = {}
+    if schema:
+        kwargs = {'dtype': schema, 'usecols': lambda col: col in schema, 'engine': 'c'}
+    if PYARROW_AVAILABLE:
+        return pd.read_csv(path, dtype_backend='pyarrow', **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def read_csv_arrow(path: Path, schema: Dict[str, str]) -> pd.DataFrame:
+    """
+    Читает CSV с известной схемой многопоточным C++ ридером pyarrow.
+    Колонки собираются сразу в непрерывные Arrow-буферы, без промежуточных Python-объектов.
+    """
+    table = pacsv.read_csv(
+        path,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20),
+        convert_options=pacsv.ConvertOptions(
+            column_types={col: pa.type_for_alias(dtype) for col, dtype in schema.items()},
+            # Пустые ячейки - пропуски, как в pd.read_csv
+            strings_can_be_null=True
+        )
+    )
+    table = table.select([col for col in table.column_names if col in schema])
+    return arrow_table_to_pandas(table)
+
+
+def read_parquet_table(path: Path, schema: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """Читает Parquet (только колонки схемы, если она передана) в DataFrame с Arrow-колонками"""
+    table = pq.read_table(path)
+    if schema:
+        table = table.select([col for col in table.column_names if col in schema])
+    return arrow_table_to_pandas(table)
+
+
+def arrow_table_to_pandas(table: 'pa.Table') -> pd.DataFrame:
+    """Переводит Arrow-таблицу в DataFrame; строки - в тот же dtype, что дает read_csv_table"""
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get, self_destruct=True)
+
+
+@lru_cache(maxsize=16)
+def load_table_cached(path_str: str, mtime_ns: int) -> pd.DataFrame:
+    """
+    Разобранный файл данных (CSV или Parquet), кэшированный по (путь, mtime).
+    Файлы данных меняются редко, поэтому повторные запросы не парсят их заново;
+    при изменении файла меняется mtime, и кэш инвалидируется сам.
+    """
+    path = Path(path_str)
+    if path.suffix == '.manifest':
+        df = arrow_table_to_pandas(read_uploaded_parts())
+    elif path.suffix == '.parquet':
+        df = read_parquet_table(path, TABLE_SCHEMAS.get(path))
+    else:
+        df = read_csv_table(path, TABLE_SCHEMAS.get(path))
+    return df.astype({col: 'category' for col in df.columns if col in CATEGORY_COLUMNS})
+
+
+def read_table_cached(path: Path) -> pd.DataFrame:
+    """
+    Читает файл данных через кэш. Возвращает поверхностную копию,
+    чтобы изменения DataFrame в обработчике не затрагивали кэш.
+    """
+    return load_table_cached(str(path), path.stat().st_mtime_ns).copy(deep=False)
+
+
+@lru_cache(maxsize=8)
+def load_patient_index(path_str: str, mtime_ns: int, patient_id_column: str) -> Dict[str, Any]:
+    """
+    Индекс "ID пациента -> позиции строк" для кэшированного файла данных.
+    ID приводятся к строке один раз при построении индекса, а не на каждый запрос.
+    """
+    df = load_table_cached(path_str, mtime_ns)
+    return df.groupby(df[patient_id_column].astype(str), sort=False).indices
+
+
+def read_patient_rows(path: Path, patient_id_column: str, patient_id: str) -> pd.DataFrame:
+    """Строки одного пациента из файла данных: поиск по кэшированному индексу вместо сравнения всей колонки"""
+    path_str = str(path)
+    mtime_ns = path.stat().st_mtime_ns
+    df = load_table_cached(path_str, mtime_ns)
+    positions = load_patient_index(path_str, mtime_ns, patient_id_column).get(str(patient_id))
+    if positions is None:
+        return df.iloc[:0]
+    return df.iloc[positions]
+
+
 def load_norms() -> Dict[str, Dict[str, Any]]:
     """Загружает нормы из data.json"""
     try:
@@ -101,6 +263,12 @@ def load_norms() -> Dict[str, Dict[str, Any]]:
         if 'total cholesterol' not in name_to_code and 'lip.cholesterol_total' in norms_dict:
             name_to_code['total cholesterol'] = 'lip.cholesterol_total'
         
+        # Категорию по коду считаем один раз при загрузке норм,
+        # чтобы get_test_category для известных кодов был одним обращением к словарю
+        for test_id, norm_info in norms_dict.items():
+            if norm_info:
+                norm_info['category'] = get_category_by_code(test_id.lower())
+        
         norms_dict['_name_mapping'] = name_to_code
         
         return norms_dict
@@ -109,47 +277,71 @@ def load_norms() -> Dict[str, Dict[str, Any]]:
         return {}
 
 
-def get_test_category(test_code: str, test_name: str = '', norms: Dict[str, Dict[str, Any]] = None) -> str:
-    """Определяет категорию анализа по test_code и названию"""
-    if not test_code:
-        return 'other'
-    
-    test_code_lower = test_code.lower()
-    test_name_lower = (test_name or '').lower()
-    
-    # ВАЖНО: Сначала проверяем на известные биохимические тесты по названию
-    # Это должно быть ДО проверки префиксов, чтобы избежать неправильной категоризации
-    biochemistry_name_keywords = [
-        'alanine', 'transaminase', 'alt', 'ast', 'aspartate', 'glucose', 
-        'creatinine', 'albumin', 'bilirubin', 'urea', 'bun', 'calcium',
-        'potassium', 'sodium', 'chloride', 'phosphate', 'magnesium',
-        'protein', 'ldh', 'alkaline', 'phosphatase', 'egfr', 'gfr',
-        'lactate', 'dehydrogenase', 'troponin', 'ck', 'creatine', 'kinase'
-    ]
-    
-    # Если название содержит ключевые слова биохимии - всегда биохимия
-    if test_name_lower and any(keyword in test_name_lower for keyword in biochemistry_name_keywords):
-        return 'biochemistry'
-    
+def get_norms_version() -> int:
+    """mtime файла норм (0, если файла нет) - ключ для кэшей, зависящих от норм"""
+    try:
+        return NORMS_PATH.stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+@lru_cache(maxsize=1)
+def load_norms_cached(norms_version: int) -> Dict[str, Dict[str, Any]]:
+    """Нормы, загруженные один раз для данной версии файла"""
+    return load_norms()
+
+
+# Ключевые слова в названии, по которым анализ всегда относится к биохимии
+BIOCHEMISTRY_NAME_KEYWORDS = (
+    'alanine', 'transaminase', 'alt', 'ast', 'aspartate', 'glucose', 
+    'creatinine', 'albumin', 'bilirubin', 'urea', 'bun', 'calcium',
+    'potassium', 'sodium', 'chloride', 'phosphate', 'magnesium',
+    'protein', 'ldh', 'alkaline', 'phosphatase', 'egfr', 'gfr',
+    'lactate', 'dehydrogenase', 'troponin', 'ck', 'creatine', 'kinase'
+)
+
+# Известные биохимические тесты (ферменты печени, глюкоза, креатинин и т.д.) - базовые коды без префикса
+BIOCHEMISTRY_TESTS = frozenset({
+    'alt', 'ast', 'glucose', 'creatinine', 'albumin', 'bilirubin', 'bun', 
+    'calcium', 'co2', 'cl', 'egfr', 'ldh', 'magnesium', 'phosphate', 
+    'potassium', 'protein', 'sodium', 't_bili', 'alkaline_phosphatase',
+    'globin', 'egfr_aa', 'egfr_non_aa', 'troponin', 'ck', 'ck_mb'
+})
+
+# Ключевые слова для определения категории по названию, если код не помог
+BIOCHEMISTRY_KEYWORDS = (
+    'alanine', 'transaminase', 'alt', 'ast', 'aspartate', 'glucose', 
+    'creatinine', 'albumin', 'bilirubin', 'urea', 'bun', 'calcium',
+    'potassium', 'sodium', 'chloride', 'phosphate', 'magnesium',
+    'protein', 'ldh', 'alkaline', 'phosphatase', 'egfr', 'gfr'
+)
+BLOOD_COUNT_KEYWORDS = (
+    'hemoglobin', 'hgb', 'hct', 'hematocrit', 'rbc', 'wbc', 'platelet',
+    'lymphocyte', 'neutrophil', 'monocyte', 'eosinophil', 'basophil',
+    'mcv', 'mch', 'mchc', 'rdw'
+)
+
+# Анализы, исключаемые из данных demo2 (more_patients.csv): Cholesterol, HDL и Glucose.
+# Названия хранятся в нижнем регистре и сравниваются с test_name.lower()
+EXCLUDED_TEST_CODES = frozenset({'lip.cholesterol_hdl', 'chem.glucose', 'test_lip_cholesterol_hdl', 'test_chem_glucose'})
+EXCLUDED_TEST_NAMES_LOWER = frozenset({'hdl', 'glucose', 'cholesterol, hdl'})
+
+
+def get_category_by_code(test_code_lower: str) -> Optional[str]:
+    """
+    Определяет категорию анализа только по коду (в нижнем регистре).
+    Возвращает None, если по коду категорию определить нельзя.
+    """
     # Специальная обработка для холестерина - может быть в chem. или lip.
     if test_code_lower == 'chem.chol' or 'cholesterol' in test_code_lower:
         return 'lipid_profile'
     
-    # Если нет префикса, пытаемся определить по коду или названию
-    # Известные биохимические тесты (ферменты печени, глюкоза, креатинин и т.д.)
-    biochemistry_tests = {
-        'alt', 'ast', 'glucose', 'creatinine', 'albumin', 'bilirubin', 'bun', 
-        'calcium', 'co2', 'cl', 'egfr', 'ldh', 'magnesium', 'phosphate', 
-        'potassium', 'protein', 'sodium', 't_bili', 'alkaline_phosphatase',
-        'globin', 'egfr_aa', 'egfr_non_aa', 'troponin', 'ck', 'ck_mb'
-    }
-    
     # Извлекаем базовое имя из кода (без префикса)
-    base_code = test_code_lower.replace('chem.', '').replace('bc.', '').replace('lip.', '').strip()
+    base_code = strip_known_prefix(test_code_lower)
     
     # Проверяем, является ли это известным биохимическим тестом
     # ВАЖНО: Если это биохимический тест, возвращаем биохимию, даже если есть префикс bc.
-    if base_code in biochemistry_tests:
+    if base_code in BIOCHEMISTRY_TESTS:
         return 'biochemistry'
     
     # Проверка по префиксам (только если не определили выше)
@@ -158,10 +350,6 @@ def get_test_category(test_code: str, test_name: str = '', norms: Dict[str, Dict
     elif test_code_lower.startswith('chem.'):
         return 'biochemistry'
     elif test_code_lower.startswith('bc.'):
-        # ВАЖНО: Проверяем, не является ли это биохимическим тестом с неправильным префиксом
-        # Если базовый код - это биохимический тест, возвращаем биохимию
-        if base_code in biochemistry_tests:
-            return 'biochemistry'
         return 'blood_count'
     elif test_code_lower.startswith('cmv.'):
         return 'infections'
@@ -170,9 +358,33 @@ def get_test_category(test_code: str, test_name: str = '', norms: Dict[str, Dict
     elif test_code_lower.startswith('lip.'):
         return 'lipid_profile'
     
+    return None
+
+
+def get_test_category(test_code_lower: str, test_name_lower: str = '', norms: Dict[str, Dict[str, Any]] = None) -> str:
+    """
+    Определяет категорию анализа по test_code и названию.
+    Ожидает уже приведенные к нижнему регистру test_code и название (вызывающий код делает .lower() один раз).
+    """
+    if not test_code_lower:
+        return 'other'
+    
+    # ВАЖНО: Сначала проверяем на известные биохимические тесты по названию
+    # Это должно быть ДО проверки префиксов, чтобы избежать неправильной категоризации
+    if test_name_lower and any(keyword in test_name_lower for keyword in BIOCHEMISTRY_NAME_KEYWORDS):
+        return 'biochemistry'
+    
+    # Быстрый путь: для кодов из норм категория посчитана заранее в load_norms
+    norm_info = norms.get(test_code_lower) if norms else None
+    if norm_info and norm_info.get('category'):
+        return norm_info['category']
+    
+    category = get_category_by_code(test_code_lower)
+    if category:
+        return category
+    
     # Проверяем по названию, если есть нормы
-    if norms and test_name:
-        test_name_lower = test_name.lower()
+    if norms and test_name_lower:
         # Ищем в нормах по названию
         for code, norm_data in norms.items():
             if code == '_name_mapping':
@@ -195,25 +407,10 @@ def get_test_category(test_code: str, test_name: str = '', norms: Dict[str, Dict
                     return 'infections'
     
     # Проверяем по ключевым словам в названии
-    if test_name:
-        test_name_lower = test_name.lower()
-        # Биохимические маркеры
-        biochemistry_keywords = [
-            'alanine', 'transaminase', 'alt', 'ast', 'aspartate', 'glucose', 
-            'creatinine', 'albumin', 'bilirubin', 'urea', 'bun', 'calcium',
-            'potassium', 'sodium', 'chloride', 'phosphate', 'magnesium',
-            'protein', 'ldh', 'alkaline', 'phosphatase', 'egfr', 'gfr'
-        ]
-        # Общий анализ крови
-        blood_count_keywords = [
-            'hemoglobin', 'hgb', 'hct', 'hematocrit', 'rbc', 'wbc', 'platelet',
-            'lymphocyte', 'neutrophil', 'monocyte', 'eosinophil', 'basophil',
-            'mcv', 'mch', 'mchc', 'rdw'
-        ]
-        
-        if any(keyword in test_name_lower for keyword in biochemistry_keywords):
+    if test_name_lower:
+        if any(keyword in test_name_lower for keyword in BIOCHEMISTRY_KEYWORDS):
             return 'biochemistry'
-        elif any(keyword in test_name_lower for keyword in blood_count_keywords):
+        elif any(keyword in test_name_lower for keyword in BLOOD_COUNT_KEYWORDS):
             return 'blood_count'
     
     # По умолчанию для неизвестных тестов без префикса - биохимия
@@ -279,6 +476,59 @@ def get_norm_info(test_code: str, test_name: str, norms: Dict[str, Dict[str, Any
     return norm_info if norm_info else {}
 
 
+@lru_cache(maxsize=4096)
+def get_norm_info_cached(test_code: str, test_name: str, norms_version: int) -> Dict[str, Any]:
+    """get_norm_info с мемоизацией: поиск по частичному названию выполняется один раз на пару код/название"""
+    return get_norm_info(test_code, test_name, load_norms_cached(norms_version))
+
+
+def parse_date_keys(dates: List[Any]) -> List[int]:
+    """
+    Преобразует строки дат в целочисленные ключи для быстрого сравнения (больше ключ - позже дата).
+    ISO даты с разными смещениями сравниваются по UTC. Даты, которые не разбираются как ISO
+    (например, 02.01.2024), сравниваются между собой как строки (как раньше) и идут раньше
+    любой разобранной даты; пустая дата получает минимальный ключ.
+    """
+    parsed = pd.to_datetime(pd.Series(dates, dtype=object), format='ISO8601', errors='coerce', utc=True, cache=True)
+    timestamps = parsed.dt.tz_convert(None).to_numpy().astype('int64').tolist()
+    keys = [
+        (0, '' if date is None else str(date)) if is_invalid else (1, timestamp)
+        for date, timestamp, is_invalid in zip(dates, timestamps, parsed.isna().tolist())
+    ]
+    # Составные ключи заменяем их рангом, чтобы сравнивать (и искать idxmax) по обычным числам
+    rank_by_key = {key: rank for rank, key in enumerate(sorted(set(keys)))}
+    return [rank_by_key[key] for key in keys]
+
+
+def with_numeric_values(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводит колонку value к числу и отбрасывает строки с невалидными значениями (даты вместо чисел и т.п.)"""
+    raw_values = df['value']
+    values = pd.to_numeric(raw_values, errors='coerce').to_numpy(dtype='float64', na_value=float('nan'), copy=True)
+    if not pd.api.types.is_numeric_dtype(raw_values):
+        # to_numeric разбирает строки быстрым, но не точным до последнего бита парсером,
+        # поэтому валидные строки переводим в число точным приведением (как float())
+        valid = ~pd.isna(values)
+        values[valid] = raw_values.to_numpy(dtype=object)[valid].astype('float64')
+    return df.assign(value=values).dropna(subset=['value'])
+
+
+def column_as_str(df: pd.DataFrame, column: str) -> pd.Series:
+    """Возвращает колонку как строки; пропуски и отсутствующая колонка дают ''"""
+    if column not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    values = df[column]
+    return values.astype(object).where(values.notna(), '').astype(str)
+
+
+def coalesce_str_columns(df: pd.DataFrame, columns: Tuple[str, ...]) -> pd.Series:
+    """Для каждой строки берет первое непустое значение из перечисленных колонок"""
+    result = pd.Series('', index=df.index, dtype=object)
+    for column in reversed(columns):
+        values = column_as_str(df, column)
+        result = values.where(values != '', result)
+    return result
+
+
 def normalize_test_code(test_code: str) -> str:
     """Нормализует test_code: убирает пробелы, приводит к нижнему регистру"""
     if not test_code:
@@ -286,6 +536,16 @@ def normalize_test_code(test_code: str) -> str:
     return test_code.strip().lower()
 
 
+def has_known_prefix(test_code_lower: str) -> bool:
+    """Проверяет, содержит ли код (в нижнем регистре) префикс chem./bc./lip."""
+    return 'chem.' in test_code_lower or 'bc.' in test_code_lower or 'lip.' in test_code_lower
+
+
+def strip_known_prefix(test_code_lower: str) -> str:
+    """Убирает префиксы chem./bc./lip. из кода (в нижнем регистре)"""
+    return test_code_lower.replace('chem.', '').replace('bc.', '').replace('lip.', '').strip()
+
+
 def normalize_test_name(test_name: str) -> str:
     """Нормализует название теста для сравнения"""
     if not test_name:
@@ -343,13 +603,20 @@ def group_by_category(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, Any
                     test_name_to_code[normalized_name] = normalized_code
     
     # Группируем по test_code и категориям, оставляя только уникальные test_code
-    # Используем словарь для каждой категории: normalized_code -> test_data (с самой поздней датой)
-    category_tests = {}  # category -> {normalized_code -> test_data}
+    # Используем словарь для каждой категории: normalized_code -> (ключ даты, test_data) с самой поздней датой
+    category_tests = {}  # category -> {normalized_code -> (date_key, test_data)}
     
     for category in groups.keys():
         category_tests[category] = {}
     
-    for row in data:
+    # Даты разбираем один раз: дальше сравниваем int64-ключи, а не строки
+    date_keys = parse_date_keys([row.get('date', '') for row in data])
+    
+    # Категорию вычисляем один раз на уникальную пару (код, название):
+    # в long-формате один и тот же анализ повторяется на каждую дату
+    category_cache = {}  # (normalized_code, test_name_lower) -> category
+    
+    for row, date_key in zip(data, date_keys):
         original_code = row.get('test_code', '').strip()
         test_name = row.get('test_name', '').strip()
         
@@ -363,8 +630,13 @@ def group_by_category(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, Any
         if not normalized_code:
             continue
         
-        # Определяем категорию по оригинальному коду и названию
-        category = get_test_category(original_code, test_name, norms)
+        # Определяем категорию по коду и названию
+        # normalized_code - это уже original_code.lower() (код обрезан выше), название приводим один раз
+        category_key = (normalized_code, test_name.lower())
+        category = category_cache.get(category_key)
+        if category is None:
+            category = get_test_category(category_key[0], category_key[1], norms)
+            category_cache[category_key] = category
         
         # Пропускаем если категория не в списке
         if category not in groups:
@@ -402,11 +674,10 @@ def group_by_category(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, Any
         
         # Проверяем, есть ли уже тест с таким нормализованным кодом в категории
         if normalized_code in category_tests[category]:
-            existing_date = category_tests[category][normalized_code].get('date', '')
-            current_date = row.get('date', '')
+            existing_date_key = category_tests[category][normalized_code][0]
             # Заменяем только если дата более поздняя
-            if current_date > existing_date:
-                category_tests[category][normalized_code] = test_data
+            if date_key > existing_date_key:
+                category_tests[category][normalized_code] = (date_key, test_data)
         else:
             # Проверяем, нет ли дубликата по названию или коду
             normalized_name = normalize_test_name(test_name) if test_name else ''
@@ -414,18 +685,20 @@ def group_by_category(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, Any
             duplicate_key = None
             
             if normalized_name:
+                # Признаки нового кода считаем один раз, а не для каждого существующего теста
+                new_has_prefix = has_known_prefix(normalized_code)
+                new_base = strip_known_prefix(normalized_code)
+                
                 # Проверяем все существующие тесты в категории на дубликаты по названию
-                for existing_normalized_code, existing_test in list(category_tests[category].items()):
+                for existing_normalized_code, (existing_date_key, existing_test) in list(category_tests[category].items()):
                     existing_name = normalize_test_name(existing_test.get('name', ''))
-                    existing_original = existing_test.get('test_code', '')
+                    existing_original_lower = existing_test.get('test_code', '').lower()
+                    existing_has_prefix = has_known_prefix(existing_original_lower)
                     
                     # Проверяем дубликат по названию
                     if normalized_name == existing_name and normalized_name:
                         # Найден дубликат по названию
                         # Используем более полный код (с префиксом предпочтительнее)
-                        new_has_prefix = 'chem.' in original_code.lower() or 'bc.' in original_code.lower() or 'lip.' in original_code.lower()
-                        existing_has_prefix = 'chem.' in existing_original.lower() or 'bc.' in existing_original.lower() or 'lip.' in existing_original.lower()
-                        
                         if new_has_prefix and not existing_has_prefix:
                             # Новый код более полный, заменяем
                             duplicate_key = existing_normalized_code
@@ -438,9 +711,7 @@ def group_by_category(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, Any
                         elif normalized_code == existing_normalized_code:
                             # Одинаковые нормализованные коды - это точно дубликат
                             # Используем более позднюю дату
-                            existing_date = existing_test.get('date', '')
-                            current_date = row.get('date', '')
-                            if current_date > existing_date:
+                            if date_key > existing_date_key:
                                 duplicate_key = existing_normalized_code
                             is_duplicate = True
                             break
@@ -448,16 +719,12 @@ def group_by_category(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, Any
                     # Также проверяем, не являются ли коды вариантами одного теста
                     # (например, "alt" и "chem.alt", или "alt" и "ALT")
                     if normalized_code != existing_normalized_code:
-                        # Извлекаем базовое имя из кода (без префикса)
-                        new_base = original_code.lower().replace('chem.', '').replace('bc.', '').replace('lip.', '').strip()
-                        existing_base = existing_original.lower().replace('chem.', '').replace('bc.', '').replace('lip.', '').strip()
+                        # Сравниваем базовые имена кодов (без префикса)
+                        existing_base = strip_known_prefix(existing_original_lower)
                         
                         if new_base == existing_base and new_base:
                             # Это один и тот же тест с разными префиксами или без
                             # Предпочитаем версию с префиксом
-                            new_has_prefix = 'chem.' in original_code.lower() or 'bc.' in original_code.lower() or 'lip.' in original_code.lower()
-                            existing_has_prefix = 'chem.' in existing_original.lower() or 'bc.' in existing_original.lower() or 'lip.' in existing_original.lower()
-                            
                             if new_has_prefix and not existing_has_prefix:
                                 duplicate_key = existing_normalized_code
                                 is_duplicate = True
@@ -471,20 +738,20 @@ def group_by_category(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, Any
                 if duplicate_key in category_tests[category]:
                     del category_tests[category][duplicate_key]
                 # Добавляем новый
-                category_tests[category][normalized_code] = test_data
+                category_tests[category][normalized_code] = (date_key, test_data)
             elif not is_duplicate:
-                category_tests[category][normalized_code] = test_data
+                category_tests[category][normalized_code] = (date_key, test_data)
     
     # Заполняем группы уникальными тестами
     for category in groups.keys():
-        groups[category] = list(category_tests[category].values())
+        groups[category] = [test_data for _, test_data in category_tests[category].values()]
     
     return groups
 
 
 def get_abnormal_tests(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Возвращает список анализов значительно не в норме (только последние значения для каждого анализа)"""
-    abnormal_by_code = {}  # test_code -> abnormal_data (с самой поздней датой)
+    abnormal_rows = []  # все отклонения, последние по дате отбираются ниже
     
     for row in data:
         test_code = row.get('test_code', '')
@@ -524,19 +791,23 @@ def get_abnormal_tests(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, An
                     'norm_max': norm_max,
                     'date': test_date
                 }
-                
-                # Если уже есть запись для этого test_code, заменяем только если текущая дата более поздняя
-                if test_code in abnormal_by_code:
-                    existing_date = abnormal_by_code[test_code].get('date', '')
-                    if test_date > existing_date:
-                        abnormal_by_code[test_code] = abnormal_data
-                else:
-                    abnormal_by_code[test_code] = abnormal_data
+                abnormal_rows.append(abnormal_data)
         except (ValueError, TypeError):
             continue
     
+    if not abnormal_rows:
+        return []
+    
+    # Для каждого test_code берем запись с самой поздней датой (при равных датах - первую).
+    # idxmax по int64-ключам дат вместо построчного сравнения строк
+    abnormal_df = pd.DataFrame({
+        'test_code': [row['test_code'] for row in abnormal_rows],
+        'date_key': parse_date_keys([row['date'] for row in abnormal_rows])
+    })
+    latest_idx = abnormal_df.groupby('test_code', sort=False, dropna=False)['date_key'].idxmax()
+    
     # Возвращаем список только последних записей для каждого анализа
-    return list(abnormal_by_code.values())
+    return [abnormal_rows[i] for i in latest_idx]
 
 
 def prepare_chart_data(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
@@ -590,7 +861,7 @@ def prepare_chart_data(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, An
             patients_data[patient_id].append(item)
         
         # Сортируем даты
-        sorted_dates = sorted(list(all_dates))
+        sorted_dates = sorted(all_dates)
         
         # Создаем датасет для каждого пациента
         datasets = []
@@ -664,10 +935,20 @@ def prepare_chart_data(data: List[Dict[str, Any]], norms: Dict[str, Dict[str, An
     return charts
 
 
+@lru_cache(maxsize=8)
+def get_file_etag(path_str: str, mtime_ns: int) -> str:
+    """
+    Вычисляет ETag (md5 содержимого) файла.
+    Кэшируется по (путь, mtime): файл перечитывается только после изменения.
+    """
+    return f'"{hashlib.md5(Path(path_str).read_bytes()).hexdigest()}"'
+
+
 @router.get("/download-file")
-async def download_file(demo_version: str = "1"):
+async def download_file(request: Request, demo_version: str = "1"):
     """
-    Скачивает файл для указанного демо варианта
+    Скачивает файл для указанного демо варианта.
+    Поддерживает If-None-Match: если у клиента актуальная версия файла, возвращает 304.
     """
     if demo_version not in DEMO_FILES:
         raise HTTPException(
@@ -676,16 +957,30 @@ async def download_file(demo_version: str = "1"):
         )
     
     file_path = DEMO_FILES[demo_version]
-    if not file_path.exists():
+    # Проверка файла (stat) - блокирующий вызов, выполняем вне event loop
+    if not await run_in_threadpool(file_path.exists):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Файл {file_path.name} не найден"
         )
     
+    stat_result = await run_in_threadpool(file_path.stat)
+    etag = await run_in_threadpool(get_file_etag, str(file_path), stat_result.st_mtime_ns)
+    cache_headers = {'ETag': etag, 'Cache-Control': 'public, max-age=3600'}
+    
+    # Клиент уже имеет эту версию файла - отвечаем 304 без тела.
+    # If-None-Match сравнивается слабо: префикс W/ (его добавляют прокси) не учитываем
+    if_none_match = request.headers.get('if-none-match', '')
+    client_etags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    if if_none_match.strip() == '*' or etag in client_etags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    
     return FileResponse(
         path=str(file_path),
         filename=file_path.name,
-        media_type="text/csv"
+        media_type="text/csv",
+        headers=cache_headers,
+        stat_result=stat_result
     )
 
 
@@ -715,48 +1010,127 @@ def map_test_short_to_code(test_short: str, norms: Dict[str, Dict[str, Any]]) ->
     return test_mapping.get(test_short_lower, f'chem.{test_short}')
 
 
+@lru_cache(maxsize=4096)
+def map_test_short_to_code_cached(test_short: str, norms_version: int) -> str:
+    """map_test_short_to_code с мемоизацией по версии файла норм"""
+    return map_test_short_to_code(test_short, load_norms_cached(norms_version))
+
+
+@lru_cache(maxsize=32)
+def resolve_columns(columns: Tuple[str, ...]) -> Dict[str, Optional[str]]:
+    """
+    Определяет, какие колонки файла содержат ID пациента, дату, код и название теста.
+    Кэшируется по набору колонок, поэтому для одного файла перебор вариантов выполняется один раз.
+    """
+    present = set(columns)
+    
+    def first_present(candidates: Tuple[str, ...]) -> Optional[str]:
+        return next((col for col in candidates if col in present), None)
+    
+    return {
+        'patient_id': first_present(PATIENT_ID_COLUMNS),
+        'date': first_present(DATE_COLUMNS),
+        'test_code': first_present(TEST_CODE_COLUMNS),
+        'test_name': first_present(TEST_NAME_COLUMNS)
+    }
+
+
+def summarize_patients(
+    df: pd.DataFrame,
+    patient_id_column: str,
+    date_column: Optional[str] = None,
+    test_column: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Статистика по всем пациентам за один проход groupby: первая/последняя дата,
+    количество уникальных тестов и количество записей. Отсортирована по ID пациента.
+    """
+    # Все агрегаты считаются одним вызовом agg по общей группировке
+    aggregations = {'record_count': (patient_id_column, 'size')}
+    if date_column:
+        aggregations['first_date'] = (date_column, 'min')
+        aggregations['last_date'] = (date_column, 'max')
+    if test_column:
+        aggregations['test_count'] = (test_column, 'nunique')
+    summary = df.groupby(patient_id_column, sort=False).agg(**aggregations)
+    summary.index = summary.index.astype(str)
+    summary = summary.sort_index()
+    
+    # Даты переводим в строки один раз для всей колонки; пустые и пропуски -> None
+    for column in ('first_date', 'last_date'):
+        dates = column_as_str(summary, column)
+        summary[column] = dates.astype(object).where(dates != '', None)
+    if not test_column:
+        summary['test_count'] = 0
+    
+    summary = summary.reset_index(names='patient_id')
+    return summary[['patient_id', 'first_date', 'last_date', 'test_count', 'record_count']].to_dict('records')
+
+
+@lru_cache(maxsize=1)
+def get_patients_summary(mtime_ns: int) -> List[Dict[str, Any]]:
+    """
+    Считает статистику по пациентам из more_patients.csv.
+    Кэшируется по mtime файла: повторные запросы не перечитывают CSV, пока файл не изменился.
+    """
+    return summarize_patients(read_table_cached(MORE_PATIENTS_FILE), 'subjectGuid', 'date', 'test_short')
+
+
+@lru_cache(maxsize=1)
+def get_test_table_patients_summary(mtime_ns: int) -> List[Dict[str, Any]]:
+    """Статистика по пациентам из test_table.csv, кэшируется по mtime файла"""
+    df = read_table_cached(TEST_TABLE_FILE)
+    columns = resolve_columns(tuple(df.columns))
+    
+    if not columns['patient_id']:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Не найдена колонка с ID пациента"
+        )
+    
+    # Количество уникальных тестов считаем по test_code, а если его нет - по test_name
+    test_column = columns['test_code'] or columns['test_name']
+    
+    return summarize_patients(df, columns['patient_id'], columns['date'], test_column)
+
+
+def get_uploaded_data_file() -> Path:
+    """
+    Файл с загруженными данными: манифест частей Parquet, если он уже создан (и доступен pyarrow),
+    затем единый Parquet прежней версии, иначе CSV (без pyarrow или пока не было загрузок)
+    """
+    if PYARROW_AVAILABLE:
+        if UPLOADED_MANIFEST_FILE.exists():
+            return UPLOADED_MANIFEST_FILE
+        if UPLOADED_PARQUET_FILE.exists():
+            return UPLOADED_PARQUET_FILE
+    return UPLOADED_DATA_FILE
+
+
+@lru_cache(maxsize=1)
+def get_uploaded_patients_summary(path_str: str, mtime_ns: int) -> List[Dict[str, Any]]:
+    """Статистика по пациентам из загруженных данных, кэшируется по (путь, mtime) файла"""
+    df = read_table_cached(Path(path_str))
+    date_column = 'date' if 'date' in df.columns else None
+    test_code_column = 'test_code' if 'test_code' in df.columns else None
+    return summarize_patients(df, 'patient_id', date_column, test_code_column)
+
+
 @router.get("/patients-list")
 async def get_patients_list() -> List[Dict[str, Any]]:
     """
     Получает список всех пациентов из файла more_patients.csv
     """
-    if not MORE_PATIENTS_FILE.exists():
+    if not await run_in_threadpool(MORE_PATIENTS_FILE.exists):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Файл {MORE_PATIENTS_FILE.name} не найден"
         )
     
     try:
-        df = pd.read_csv(MORE_PATIENTS_FILE)
-        
-        # Получаем уникальных пациентов и их статистику
-        patients = []
-        for patient_id in df['subjectGuid'].unique():
-            patient_data = df[df['subjectGuid'] == patient_id]
-            
-            # Получаем первую и последнюю дату
-            dates = sorted(patient_data['date'].unique())
-            first_date = dates[0] if dates else None
-            last_date = dates[-1] if dates else None
-            
-            # Подсчитываем количество тестов
-            test_count = len(patient_data['test_short'].unique())
-            
-            # Подсчитываем количество записей
-            record_count = len(patient_data)
-            
-            patients.append({
-                'patient_id': patient_id,
-                'first_date': first_date,
-                'last_date': last_date,
-                'test_count': test_count,
-                'record_count': record_count
-            })
-        
-        # Сортируем по ID пациента
-        patients.sort(key=lambda x: x['patient_id'])
-        
-        return patients
+        # Чтение CSV блокирующее - выполняем в пуле потоков, чтобы не занимать event loop
+        mtime_ns = (await run_in_threadpool(MORE_PATIENTS_FILE.stat)).st_mtime_ns
+        return await run_in_threadpool(get_patients_summary, mtime_ns)
     
     except Exception as e:
         logger.error(f"Ошибка получения списка пациентов: {e}")
@@ -766,6 +1140,63 @@ async def get_patients_list() -> List[Dict[str, Any]]:
         )
 
 
+def build_patient_data_by_id(patient_id: str) -> Dict[str, Any]:
+    """Собирает данные пациента из more_patients.csv (синхронная часть эндпоинта, выполняется в пуле потоков)"""
+    # Загружаем строки пациента из CSV
+    patient_df = read_patient_rows(MORE_PATIENTS_FILE, 'subjectGuid', patient_id)
+
+    if patient_df.empty:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Пациент {patient_id} не найден"
+        )
+
+    # Загружаем нормы
+    norms_version = get_norms_version()
+    norms = load_norms_cached(norms_version)
+
+    # Нормализуем структуру данных колоночными операциями
+    # (строки с невалидными значениями отбрасываются)
+    patient_df = with_numeric_values(patient_df)
+    test_names = column_as_str(patient_df, 'test_short')
+
+    # Маппинг test_short -> test_code считаем один раз на уникальное название
+    code_by_short = {short: map_test_short_to_code_cached(short, norms_version) for short in test_names.unique()}
+
+    normalized_df = pd.DataFrame({
+        'patient_id': column_as_str(patient_df, 'subjectGuid'),
+        'test_code': test_names.map(code_by_short),
+        'test_name': test_names,
+        'value': patient_df['value'],
+        'date': column_as_str(patient_df, 'date'),
+        'unit': ''  # Будет заполнено из норм
+    })
+
+    # Фильтруем проблемные анализы для demo2
+    # Исключаем Cholesterol, HDL и Glucose
+    normalized_df = normalized_df[
+        ~normalized_df['test_code'].isin(EXCLUDED_TEST_CODES)
+        & ~normalized_df['test_name'].str.lower().isin(EXCLUDED_TEST_NAMES_LOWER)
+    ]
+    data = normalized_df.to_dict('records')
+
+    # Группируем по категориям
+    groups = group_by_category(data, norms)
+
+    # Получаем анализы не в норме
+    abnormal_tests = get_abnormal_tests(data, norms)
+
+    # Подготавливаем данные для графиков
+    charts = prepare_chart_data(data, norms)
+
+    return {
+        'patient_id': patient_id,
+        'groups': groups,
+        'abnormal_tests': abnormal_tests,
+        'charts': charts
+    }
+
+
 @router.get("/patient-data-by-id")
 async def get_patient_data_by_id(patient_id: str) -> Dict[str, Any]:
     """
@@ -781,69 +1212,7 @@ async def get_patient_data_by_id(patient_id: str) -> Dict[str, Any]:
         )
     
     try:
-        # Загружаем данные из CSV
-        df = pd.read_csv(MORE_PATIENTS_FILE)
-        
-        # Фильтруем по patient_id
-        patient_df = df[df['subjectGuid'] == patient_id]
-        
-        if patient_df.empty:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Пациент {patient_id} не найден"
-            )
-        
-        # Загружаем нормы
-        norms = load_norms()
-        
-        # Нормализуем структуру данных
-        data = []
-        for _, row in patient_df.iterrows():
-            test_short = row.get('test_short', '')
-            test_code = map_test_short_to_code(test_short, norms)
-            
-            normalized_row = {
-                'patient_id': row.get('subjectGuid', ''),
-                'test_code': test_code,
-                'test_name': test_short,
-                'value': row.get('value', None),
-                'date': row.get('date', ''),
-                'unit': ''  # Будет заполнено из норм
-            }
-            
-            # Пропускаем строки с невалидными значениями
-            try:
-                float(normalized_row['value'])
-            except (ValueError, TypeError):
-                continue
-            
-            data.append(normalized_row)
-        
-        # Фильтруем проблемные анализы для demo2
-        # Исключаем Cholesterol, HDL и Glucose
-        excluded_test_codes = ['lip.cholesterol_hdl', 'chem.glucose', 'test_lip_cholesterol_hdl', 'test_chem_glucose']
-        excluded_test_names = ['hdl', 'glucose', 'cholesterol, hdl']
-        data = [
-            row for row in data 
-            if row.get('test_code', '') not in excluded_test_codes 
-            and row.get('test_name', '').lower() not in [name.lower() for name in excluded_test_names]
-        ]
-        
-        # Группируем по категориям
-        groups = group_by_category(data, norms)
-        
-        # Получаем анализы не в норме
-        abnormal_tests = get_abnormal_tests(data, norms)
-        
-        # Подготавливаем данные для графиков
-        charts = prepare_chart_data(data, norms)
-        
-        return {
-            'patient_id': patient_id,
-            'groups': groups,
-            'abnormal_tests': abnormal_tests,
-            'charts': charts
-        }
+        return await run_in_threadpool(build_patient_data_by_id, patient_id)
     
     except HTTPException:
         raise
@@ -872,76 +1241,9 @@ async def get_patients_list_from_test_table() -> List[Dict[str, Any]]:
         )
     
     try:
-        df = pd.read_csv(TEST_TABLE_FILE)
-        
-        # Получаем уникальных пациентов и их статистику
-        patients = []
-        patient_id_column = None
-        
-        # Определяем колонку с ID пациента
-        possible_columns = ['subjectGuid', 'subject_guid', 'patient_id', 'patientId', 'id']
-        for col in possible_columns:
-            if col in df.columns:
-                patient_id_column = col
-                break
-        
-        if not patient_id_column:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Не найдена колонка с ID пациента"
-            )
-        
-        for patient_id in df[patient_id_column].unique():
-            patient_data = df[df[patient_id_column] == patient_id]
-            
-            # Получаем первую и последнюю дату
-            date_column = None
-            for col in ['date', 'Date', 'DATE', 'draw_date', 'analysis_date']:
-                if col in df.columns:
-                    date_column = col
-                    break
-            
-            if date_column:
-                dates = sorted(patient_data[date_column].dropna().unique())
-                first_date = dates[0] if dates else None
-                last_date = dates[-1] if dates else None
-            else:
-                first_date = None
-                last_date = None
-            
-            # Подсчитываем количество уникальных тестов (по test_code или test_name)
-            test_code_column = None
-            for col in ['test_code', 'original_column']:
-                if col in df.columns:
-                    test_code_column = col
-                    break
-            
-            if test_code_column:
-                test_count = len(patient_data[test_code_column].dropna().unique())
-            else:
-                # Если нет test_code, считаем по test_name
-                test_name_column = None
-                for col in ['test_name', 'test_short']:
-                    if col in df.columns:
-                        test_name_column = col
-                        break
-                if test_name_column:
-                    test_count = len(patient_data[test_name_column].dropna().unique())
-                else:
-                    test_count = 0
-            
-            patients.append({
-                'patient_id': str(patient_id),
-                'first_date': str(first_date) if first_date else None,
-                'last_date': str(last_date) if last_date else None,
-                'test_count': test_count,
-                'record_count': len(patient_data)
-            })
-        
-        # Сортируем по ID пациента
-        patients.sort(key=lambda x: x['patient_id'])
-        
-        return patients
+        # Разбор CSV и группировка - блокирующая работа, выполняем в пуле потоков
+        mtime_ns = (await run_in_threadpool(TEST_TABLE_FILE.stat)).st_mtime_ns
+        return await run_in_threadpool(get_test_table_patients_summary, mtime_ns)
     
     except Exception as e:
         logger.error(f"Ошибка получения списка пациентов: {e}")
@@ -951,6 +1253,85 @@ async def get_patients_list_from_test_table() -> List[Dict[str, Any]]:
         )
 
 
+def build_patient_data_from_test_table(patient_id: str) -> Dict[str, Any]:
+    """Собирает данные пациента из test_table.csv (синхронная часть эндпоинта, выполняется в пуле потоков)"""
+    # Загружаем данные из CSV
+    df = read_table_cached(TEST_TABLE_FILE)
+
+    # Определяем колонку с ID пациента
+    patient_id_column = resolve_columns(tuple(df.columns))['patient_id']
+
+    if not patient_id_column:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Не найдена колонка с ID пациента"
+        )
+
+    # Фильтруем по patient_id
+    patient_df = read_patient_rows(TEST_TABLE_FILE, patient_id_column, patient_id)
+
+    if patient_df.empty:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Пациент {patient_id} не найден"
+        )
+
+    # Загружаем нормы
+    norms_version = get_norms_version()
+    norms = load_norms_cached(norms_version)
+
+    # Нормализуем структуру данных (long format) колоночными операциями
+    # (строки с невалидными значениями отбрасываются)
+    patient_df = with_numeric_values(patient_df)
+    test_codes = coalesce_str_columns(patient_df, TEST_CODE_COLUMNS)
+    test_names = coalesce_str_columns(patient_df, TEST_NAME_COLUMNS)
+    units = column_as_str(patient_df, 'unit')
+
+    # Если test_name пустое, пытаемся найти в нормах (один поиск на уникальный код)
+    missing_name = (test_names == '') & (test_codes != '')
+    if missing_name.any():
+        name_by_code = {
+            code: get_norm_info_cached(code, '', norms_version).get('name') or code
+            for code in test_codes[missing_name].unique()
+        }
+        test_names = test_names.mask(missing_name, test_codes.map(name_by_code))
+
+    # Если unit пустое, пытаемся найти в нормах (один поиск на уникальную пару код/название)
+    missing_unit = (units == '') & (test_codes != '')
+    if missing_unit.any():
+        pairs = pd.Series(list(zip(test_codes[missing_unit], test_names[missing_unit])), index=test_codes[missing_unit].index)
+        unit_by_pair = {
+            (code, name): get_norm_info_cached(code, name, norms_version).get('unit') or ''
+            for code, name in pairs.unique()
+        }
+        units = units.mask(missing_unit, pairs.map(unit_by_pair.get))
+
+    data = pd.DataFrame({
+        'patient_id': str(patient_id),  # строки уже отобраны по этому id
+        'test_code': test_codes,
+        'test_name': test_names,
+        'value': patient_df['value'],
+        'date': column_as_str(patient_df, 'date'),
+        'unit': units
+    }).to_dict('records')
+
+    # Группируем по категориям
+    groups = group_by_category(data, norms)
+
+    # Получаем анализы не в норме
+    abnormal_tests = get_abnormal_tests(data, norms)
+
+    # Подготавливаем данные для графиков
+    charts = prepare_chart_data(data, norms)
+
+    return {
+        'patient_id': str(patient_id),
+        'groups': groups,
+        'abnormal_tests': abnormal_tests,
+        'charts': charts
+    }
+
+
 @router.get("/patient-data-from-test-table")
 async def get_patient_data_from_test_table(patient_id: str) -> Dict[str, Any]:
     """
@@ -971,91 +1352,7 @@ async def get_patient_data_from_test_table(patient_id: str) -> Dict[str, Any]:
         )
     
     try:
-        # Загружаем данные из CSV
-        df = pd.read_csv(TEST_TABLE_FILE)
-        
-        # Определяем колонку с ID пациента
-        patient_id_column = None
-        possible_columns = ['subjectGuid', 'subject_guid', 'patient_id', 'patientId', 'id']
-        for col in possible_columns:
-            if col in df.columns:
-                patient_id_column = col
-                break
-        
-        if not patient_id_column:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Не найдена колонка с ID пациента"
-            )
-        
-        # Фильтруем по patient_id
-        patient_df = df[df[patient_id_column].astype(str) == str(patient_id)]
-        
-        if patient_df.empty:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Пациент {patient_id} не найден"
-            )
-        
-        # Загружаем нормы
-        norms = load_norms()
-        
-        # Нормализуем структуру данных (long format)
-        data = []
-        for _, row in patient_df.iterrows():
-            # Получаем значения из строки
-            test_code = row.get('test_code', '') or row.get('original_column', '')
-            test_name = row.get('test_name', '') or row.get('test_short', '')
-            value = row.get('value', None)
-            date_value = row.get('date', '')
-            unit = row.get('unit', '')
-            
-            # Пропускаем строки с невалидными значениями
-            try:
-                float_value = float(value)
-            except (ValueError, TypeError):
-                continue
-            
-            # Если test_name пустое, пытаемся найти в нормах
-            if not test_name and test_code:
-                norm_info = get_norm_info(test_code, '', norms)
-                if norm_info and norm_info.get('name'):
-                    test_name = norm_info.get('name', test_code)
-                else:
-                    test_name = test_code
-            
-            # Если unit пустое, пытаемся найти в нормах
-            if not unit and test_code:
-                norm_info = get_norm_info(test_code, test_name, norms)
-                if norm_info and norm_info.get('unit'):
-                    unit = norm_info.get('unit', '')
-            
-            normalized_row = {
-                'patient_id': str(row[patient_id_column]),
-                'test_code': test_code,
-                'test_name': test_name,
-                'value': float_value,
-                'date': str(date_value) if date_value else '',
-                'unit': unit
-            }
-            
-            data.append(normalized_row)
-        
-        # Группируем по категориям
-        groups = group_by_category(data, norms)
-        
-        # Получаем анализы не в норме
-        abnormal_tests = get_abnormal_tests(data, norms)
-        
-        # Подготавливаем данные для графиков
-        charts = prepare_chart_data(data, norms)
-        
-        return {
-            'patient_id': str(patient_id),
-            'groups': groups,
-            'abnormal_tests': abnormal_tests,
-            'charts': charts
-        }
+        return await run_in_threadpool(build_patient_data_from_test_table, patient_id)
     
     except HTTPException:
         raise
@@ -1067,6 +1364,43 @@ async def get_patient_data_from_test_table(patient_id: str) -> Dict[str, Any]:
         )
 
 
+def build_patient_data(file_path: Path) -> Dict[str, Any]:
+    """Собирает данные пациента из файла демо варианта (синхронная часть эндпоинта, выполняется в пуле потоков)"""
+    # Загружаем данные из CSV
+    df = read_table_cached(file_path)
+
+    # Нормализуем структуру данных: patient_long_table.csv имеет другую структуру
+    # subjectGuid -> patient_id, original_column -> test_code, test_short -> test_name (но нужно получить из норм)
+    # Строки с невалидными значениями (даты вместо чисел) отбрасываются
+    df = with_numeric_values(df)
+    data = pd.DataFrame({
+        'patient_id': column_as_str(df, 'subjectGuid'),
+        'test_code': column_as_str(df, 'original_column'),
+        'test_name': column_as_str(df, 'test_short'),  # Это короткое название, нужно найти полное
+        'value': df['value'],
+        'date': column_as_str(df, 'date'),
+        'unit': ''  # Будет заполнено из норм
+    }).to_dict('records')
+
+    # Загружаем нормы
+    norms = load_norms_cached(get_norms_version())
+
+    # Группируем по категориям
+    groups = group_by_category(data, norms)
+
+    # Получаем анализы не в норме
+    abnormal_tests = get_abnormal_tests(data, norms)
+
+    # Подготавливаем данные для графиков (только для одного пациента)
+    charts = prepare_chart_data(data, norms)
+
+    return {
+        'groups': groups,
+        'abnormal_tests': abnormal_tests,
+        'charts': charts
+    }
+
+
 @router.get("/patient-data")
 async def get_patient_data(demo_version: str = "1") -> Dict[str, Any]:
     """
@@ -1094,47 +1428,7 @@ async def get_patient_data(demo_version: str = "1") -> Dict[str, Any]:
         )
     
     try:
-        # Загружаем данные из CSV
-        df = pd.read_csv(file_path)
-        
-        # Нормализуем структуру данных: patient_long_table.csv имеет другую структуру
-        # subjectGuid -> patient_id, original_column -> test_code, test_short -> test_name (но нужно получить из норм)
-        data = []
-        for _, row in df.iterrows():
-            normalized_row = {
-                'patient_id': row.get('subjectGuid', ''),
-                'test_code': row.get('original_column', ''),
-                'test_name': row.get('test_short', ''),  # Это короткое название, нужно найти полное
-                'value': row.get('value', None),
-                'date': row.get('date', ''),
-                'unit': ''  # Будет заполнено из норм
-            }
-            
-            # Пропускаем строки с невалидными значениями (даты вместо чисел)
-            try:
-                float(normalized_row['value'])
-            except (ValueError, TypeError):
-                continue
-            
-            data.append(normalized_row)
-        
-        # Загружаем нормы
-        norms = load_norms()
-        
-        # Группируем по категориям
-        groups = group_by_category(data, norms)
-        
-        # Получаем анализы не в норме
-        abnormal_tests = get_abnormal_tests(data, norms)
-        
-        # Подготавливаем данные для графиков (только для одного пациента)
-        charts = prepare_chart_data(data, norms)
-        
-        return {
-            'groups': groups,
-            'abnormal_tests': abnormal_tests,
-            'charts': charts
-        }
+        return await run_in_threadpool(build_patient_data, file_path)
     
     except Exception as e:
         logger.error(f"Ошибка обработки данных пациента: {e}")
@@ -1144,6 +1438,231 @@ async def get_patient_data(demo_version: str = "1") -> Dict[str, Any]:
         )
 
 
+# Ключ записи в загруженных данных: новая запись с тем же ключом заменяет старую
+UPLOADED_KEY_COLUMNS = ['patient_id', 'test_code', 'date']
+# Загрузки обрабатываются в пуле потоков - запись загруженных данных сериализуем
+# (RLock: восстановление манифеста вызывается и внутри сохранения)
+UPLOADED_DATA_LOCK = threading.RLock()
+
+
+def hash_uploaded_keys(df: pd.DataFrame) -> np.ndarray:
+    """Векторные 64-битные хэши ключей (patient_id, test_code, date) записей"""
+    keys = pd.DataFrame({col: column_as_str(df, col) for col in UPLOADED_KEY_COLUMNS})
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def normalize_uploaded_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Единые типы колонок загруженных данных: value - число, остальное - строки"""
+    df = with_numeric_values(df)
+    return df.astype({col: 'string' for col in df.columns if col != 'value'})
+
+
+def write_parquet_atomic(df: pd.DataFrame, path: Path) -> None:
+    """Записывает Parquet через временный файл и замену: читатели не увидят недописанный файл"""
+    # Имя с точкой в начале: pyarrow не считает такой файл частью набора данных
+    temp_file = path.with_name(f".{path.name}.tmp")
+    try:
+        df.to_parquet(temp_file, compression='snappy', index=False)
+        os.replace(temp_file, path)
+    finally:
+        temp_file.unlink(missing_ok=True)
+
+
+def load_uploaded_manifest() -> Optional[Dict[str, Any]]:
+    """
+    Манифест загруженных данных: {parts: [имена файлов частей], hashes: отсортированные хэши ключей, rows: число строк}.
+    None, если манифеста еще нет или он не читается.
+    """
+    try:
+        with open(UPLOADED_MANIFEST_FILE, 'rb') as f:
+            manifest = pickle.load(f)
+        return {'parts': manifest['parts'], 'hashes': manifest['hashes'], 'rows': manifest['rows']}
+    except (OSError, EOFError, pickle.UnpicklingError, KeyError) as e:
+        logger.debug(f"Манифест загруженных данных не прочитан: {e}")
+        return None
+
+
+def save_uploaded_manifest(parts: List[str], hashes: np.ndarray, row_count: int) -> None:
+    """Сохраняет манифест загруженных данных (запись через временный файл и замену)"""
+    temp_file = UPLOADED_MANIFEST_FILE.with_suffix('.manifest.tmp')
+    with open(temp_file, 'wb') as f:
+        pickle.dump({'parts': parts, 'hashes': hashes, 'rows': row_count}, f)
+    os.replace(temp_file, UPLOADED_MANIFEST_FILE)
+
+
+def list_uploaded_parts() -> List[str]:
+    """Имена файлов частей на диске в порядке записи (имя содержит время записи)"""
+    if not UPLOADED_PARTS_DIR.exists():
+        return []
+    return sorted(part_file.name for part_file in UPLOADED_PARTS_DIR.glob('part-*.parquet'))
+
+
+def rebuild_uploaded_manifest() -> Optional[Dict[str, Any]]:
+    """
+    Восстанавливает манифест по частям на диске (манифест поврежден или удален).
+    Части читаются в порядке записи, из повторяющихся ключей остается последняя запись -
+    части, оставшиеся от прошлой пересборки, так ничего не перезаписывают.
+    Все данные собираются в одну новую часть, прежние части удаляются на следующей записи.
+    Если частей нет, поврежденный манифест удаляется. Вызывается под UPLOADED_DATA_LOCK.
+    """
+    parts = list_uploaded_parts()
+    logger.warning(f"Манифест загруженных данных {UPLOADED_MANIFEST_FILE} не читается, восстанавливаем по {len(parts)} частям")
+    if not parts:
+        UPLOADED_MANIFEST_FILE.unlink(missing_ok=True)
+        return None
+    
+    table = pa.concat_tables([pq.read_table(UPLOADED_PARTS_DIR / part) for part in parts])
+    df = arrow_table_to_pandas(table).drop_duplicates(subset=UPLOADED_KEY_COLUMNS, keep='last')
+    df = normalize_uploaded_rows(df)
+    save_uploaded_manifest([write_uploaded_part(df)], np.unique(hash_uploaded_keys(df)), len(df))
+    return load_uploaded_manifest()
+
+
+def get_uploaded_manifest() -> Optional[Dict[str, Any]]:
+    """
+    Манифест загруженных данных. Если он не читается (или удален, а части на диске есть),
+    восстанавливается по частям. None - загруженных данных в частях нет.
+    """
+    manifest = load_uploaded_manifest()
+    if manifest is not None or not (UPLOADED_MANIFEST_FILE.exists() or list_uploaded_parts()):
+        return manifest
+    with UPLOADED_DATA_LOCK:
+        # Пока ждали блокировку, манифест мог восстановить другой поток
+        manifest = load_uploaded_manifest()
+        if manifest is None:
+            manifest = rebuild_uploaded_manifest()
+    return manifest
+
+
+def read_uploaded_parts() -> 'pa.Table':
+    """Читает все части загруженных данных из манифеста одной Arrow-таблицей"""
+    manifest = get_uploaded_manifest()
+    if manifest is None:
+        raise ValueError(f"Манифест загруженных данных {UPLOADED_MANIFEST_FILE} не читается")
+    return pa.concat_tables([pq.read_table(UPLOADED_PARTS_DIR / part) for part in manifest['parts']])
+
+
+def write_uploaded_part(df: pd.DataFrame) -> str:
+    """Записывает новую часть загруженных данных и возвращает имя ее файла"""
+    UPLOADED_PARTS_DIR.mkdir(parents=True, exist_ok=True)
+    part = f"part-{time.time_ns():020d}.parquet"
+    write_parquet_atomic(df, UPLOADED_PARTS_DIR / part)
+    return part
+
+
+def remove_stale_uploaded_parts(manifest: Dict[str, Any]) -> None:
+    """
+    Удаляет части, которых нет в прочитанном манифесте (остались от прошлой пересборки).
+    Удаляются на следующей записи, а не сразу: запрос, прочитавший старый манифест, успевает дочитать части.
+    Вызывается только с успешно прочитанным манифестом.
+    """
+    live_parts = set(manifest['parts'])
+    for part in list_uploaded_parts():
+        if part not in live_parts:
+            (UPLOADED_PARTS_DIR / part).unlink(missing_ok=True)
+
+
+def save_uploaded_rows(new_df: pd.DataFrame) -> int:
+    """
+    Сохраняет новые записи в загруженные данные и возвращает общее число записей.
+    Новые записи заменяют старые с тем же ключом.
+    """
+    if PYARROW_AVAILABLE:
+        return save_uploaded_rows_parquet(new_df)
+    return save_uploaded_rows_csv(new_df)
+
+
+def save_uploaded_rows_parquet(new_df: pd.DataFrame) -> int:
+    """
+    Сохраняет записи в Parquet по частям: каждая загрузка - отдельный файл в UPLOADED_PARTS_DIR,
+    список частей, хэши ключей и число строк хранятся в манифесте.
+    Если ни один ключ новых записей не встречается в сохраненных, новая часть просто добавляется
+    (без перечитывания и перезаписи всей истории). Иначе данные пересобираются в одну часть.
+    Совпадение хэшей (в том числе случайная коллизия) ведет к пересборке, что всегда корректно.
+    
+    Данные, сохраненные до перехода на части (CSV или единый Parquet), переносятся при первой загрузке.
+    """
+    new_df = normalize_uploaded_rows(new_df).drop_duplicates(subset=UPLOADED_KEY_COLUMNS, keep='last')
+    manifest = get_uploaded_manifest()
+    
+    if manifest is not None:
+        remove_stale_uploaded_parts(manifest)
+        new_hashes = hash_uploaded_keys(new_df)
+        if not np.isin(new_hashes, manifest['hashes']).any():
+            parts = manifest['parts'] + [write_uploaded_part(new_df)]
+            total = manifest['rows'] + len(new_df)
+            save_uploaded_manifest(parts, np.union1d(manifest['hashes'], new_hashes), total)
+            return total
+        existing_file = UPLOADED_MANIFEST_FILE
+    else:
+        existing_file = get_uploaded_data_file()
+    
+    if existing_file.exists():
+        combined_df = pd.concat([read_table_cached(existing_file), new_df], ignore_index=True)
+        combined_df = combined_df.drop_duplicates(subset=UPLOADED_KEY_COLUMNS, keep='last')
+        combined_df = normalize_uploaded_rows(combined_df)
+    else:
+        combined_df = new_df
+    
+    save_uploaded_manifest(
+        [write_uploaded_part(combined_df)],
+        np.unique(hash_uploaded_keys(combined_df)),
+        len(combined_df)
+    )
+    
+    if existing_file == UPLOADED_PARQUET_FILE:
+        # Единый Parquet перенесен в части и больше не читается
+        UPLOADED_PARQUET_FILE.unlink(missing_ok=True)
+    elif existing_file == UPLOADED_DATA_FILE:
+        logger.info(
+            f"Загруженные данные перенесены из {UPLOADED_DATA_FILE} в {UPLOADED_PARTS_DIR}; "
+            f"CSV оставлен как есть и больше не используется"
+        )
+    return len(combined_df)
+
+
+def save_uploaded_rows_csv(new_df: pd.DataFrame) -> int:
+    """Сохраняет записи в CSV (без pyarrow): файл пересобирается целиком через временный файл и замену"""
+    if UPLOADED_DATA_FILE.exists():
+        combined_df = pd.concat([read_table_cached(UPLOADED_DATA_FILE), new_df], ignore_index=True)
+        combined_df = combined_df.drop_duplicates(subset=UPLOADED_KEY_COLUMNS, keep='last')
+    else:
+        combined_df = new_df
+    temp_file = UPLOADED_DATA_FILE.with_suffix('.csv.tmp')
+    try:
+        combined_df.to_csv(temp_file, index=False)
+        os.replace(temp_file, UPLOADED_DATA_FILE)
+    finally:
+        temp_file.unlink(missing_ok=True)
+    return len(combined_df)
+
+
+def import_uploaded_file(temp_file: Path) -> Dict[str, Any]:
+    """Разбирает загруженный CSV и сохраняет записи (синхронная часть эндпоинта, выполняется в пуле потоков)"""
+    df = read_csv_table(temp_file)
+    required_columns = ['patient_id', 'test_code', 'value']
+    missing = [col for col in required_columns if col not in df.columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Отсутствуют колонки: {', '.join(missing)}")
+    df = with_numeric_values(df)
+    test_codes = column_as_str(df, 'test_code')
+    new_df = pd.DataFrame({
+        'patient_id': column_as_str(df, 'patient_id'),
+        'test_code': test_codes,
+        'test_name': column_as_str(df, 'test_name') if 'test_name' in df.columns else test_codes,
+        'value': df['value'],
+        'unit': column_as_str(df, 'unit'),
+        'date': column_as_str(df, 'date'),
+        'status': column_as_str(df, 'status')
+    })
+    new_df = new_df[(new_df['patient_id'] != '') & (new_df['test_code'] != '')]
+    if new_df.empty:
+        raise HTTPException(status_code=400, detail="Нет валидных данных")
+    with UPLOADED_DATA_LOCK:
+        total = save_uploaded_rows(new_df)
+    return {'success': True, 'message': f'Загружено записей: {len(new_df)}', 'total': total}
+
+
 @router.post("/upload-patient-data")
 async def upload_patient_data(file: UploadFile = File(...)) -> Dict[str, Any]:
     """Загружает файл с данными пациента и добавляет их в систему."""
@@ -1152,45 +1671,9 @@ async def upload_patient_data(file: UploadFile = File(...)) -> Dict[str, Any]:
             raise HTTPException(status_code=400, detail="Поддерживаются только CSV файлы")
         contents = await file.read()
         temp_file = Path(__file__).parent.parent.parent / "data" / f"temp_{file.filename}"
-        with open(temp_file, 'wb') as f:
-            f.write(contents)
+        await run_in_threadpool(temp_file.write_bytes, contents)
         try:
-            df = pd.read_csv(temp_file)
-            required_columns = ['patient_id', 'test_code', 'value']
-            missing = [col for col in required_columns if col not in df.columns]
-            if missing:
-                raise HTTPException(status_code=400, detail=f"Отсутствуют колонки: {', '.join(missing)}")
-            normalized_data = []
-            for _, row in df.iterrows():
-                patient_id = str(row.get('patient_id', ''))
-                test_code = str(row.get('test_code', ''))
-                value = row.get('value', None)
-                if not patient_id or not test_code or pd.isna(value):
-                    continue
-                try:
-                    float_value = float(value)
-                except:
-                    continue
-                normalized_data.append({
-                    'patient_id': patient_id,
-                    'test_code': test_code,
-                    'test_name': str(row.get('test_name', '')) if 'test_name' in df.columns else test_code,
-                    'value': float_value,
-                    'unit': str(row.get('unit', '')) if 'unit' in df.columns else '',
-                    'date': str(row.get('date', '')) if 'date' in df.columns else '',
-                    'status': str(row.get('status', '')) if 'status' in df.columns else ''
-                })
-            if not normalized_data:
-                raise HTTPException(status_code=400, detail="Нет валидных данных")
-            if UPLOADED_DATA_FILE.exists():
-                existing_df = pd.read_csv(UPLOADED_DATA_FILE)
-                new_df = pd.DataFrame(normalized_data)
-                combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-                combined_df = combined_df.drop_duplicates(subset=['patient_id', 'test_code', 'date'], keep='last')
-            else:
-                combined_df = pd.DataFrame(normalized_data)
-            combined_df.to_csv(UPLOADED_DATA_FILE, index=False)
-            return {'success': True, 'message': f'Загружено записей: {len(normalized_data)}', 'total': len(combined_df)}
+            return await run_in_threadpool(import_uploaded_file, temp_file)
         finally:
             if temp_file.exists():
                 temp_file.unlink()
@@ -1204,92 +1687,72 @@ async def upload_patient_data(file: UploadFile = File(...)) -> Dict[str, Any]:
 @router.get("/patients-list-from-uploaded")
 async def get_patients_list_from_uploaded() -> List[Dict[str, Any]]:
     """Получает список всех пациентов из загруженных файлов"""
-    if not UPLOADED_DATA_FILE.exists():
+    uploaded_file = get_uploaded_data_file()
+    if not uploaded_file.exists():
         return []
     try:
-        df = pd.read_csv(UPLOADED_DATA_FILE)
-        patients = []
-        for patient_id in df['patient_id'].unique():
-            patient_data = df[df['patient_id'] == patient_id]
-            date_column = 'date' if 'date' in df.columns else None
-            if date_column:
-                dates = sorted(patient_data[date_column].dropna().unique())
-                first_date = dates[0] if dates else None
-                last_date = dates[-1] if dates else None
-            else:
-                first_date = None
-                last_date = None
-            test_code_column = 'test_code' if 'test_code' in df.columns else None
-            if test_code_column:
-                test_count = len(patient_data[test_code_column].dropna().unique())
-            else:
-                test_count = 0
-            patients.append({
-                'patient_id': str(patient_id),
-                'first_date': str(first_date) if first_date else None,
-                'last_date': str(last_date) if last_date else None,
-                'test_count': test_count,
-                'record_count': len(patient_data)
-            })
-        patients.sort(key=lambda x: x['patient_id'])
-        return patients
+        mtime_ns = (await run_in_threadpool(uploaded_file.stat)).st_mtime_ns
+        return await run_in_threadpool(get_uploaded_patients_summary, str(uploaded_file), mtime_ns)
     except Exception as e:
         logger.error(f"Ошибка получения списка пациентов из загруженных данных: {e}")
         return []
 
 
+def build_patient_data_from_uploaded(uploaded_file: Path, patient_id: str) -> Dict[str, Any]:
+    """Собирает данные пациента из загруженных данных (синхронная часть эндпоинта, выполняется в пуле потоков)"""
+    patient_df = read_patient_rows(uploaded_file, 'patient_id', patient_id)
+    if patient_df.empty:
+        raise HTTPException(status_code=404, detail=f"Пациент {patient_id} не найден в загруженных данных")
+    norms_version = get_norms_version()
+    norms = load_norms_cached(norms_version)
+    patient_df = with_numeric_values(patient_df)
+    test_codes = column_as_str(patient_df, 'test_code')
+    test_names = column_as_str(patient_df, 'test_name') if 'test_name' in patient_df.columns else test_codes
+    units = column_as_str(patient_df, 'unit')
+    # Нормы ищем один раз на уникальный код / пару код-название
+    missing_name = (test_names == '') | (test_names == test_codes)
+    if missing_name.any():
+        name_by_code = {code: get_norm_info_cached(code, '', norms_version).get('name') for code in test_codes[missing_name].unique()}
+        norm_names = test_codes.map(name_by_code)
+        test_names = test_names.mask(missing_name & norm_names.notna() & (norm_names != ''), norm_names)
+    missing_unit = (units == '') & (test_codes != '')
+    if missing_unit.any():
+        pairs = pd.Series(list(zip(test_codes[missing_unit], test_names[missing_unit])), index=test_codes[missing_unit].index)
+        unit_by_pair = {
+            (code, name): get_norm_info_cached(code, name, norms_version).get('unit') or ''
+            for code, name in pairs.unique()
+        }
+        units = units.mask(missing_unit, pairs.map(unit_by_pair.get))
+    # Get status from CSV if available
+    statuses = column_as_str(patient_df, 'status').str.strip().str.upper()
+    data = pd.DataFrame({
+        'patient_id': str(patient_id),
+        'test_code': test_codes,
+        'test_name': test_names,
+        'value': patient_df['value'],
+        'date': column_as_str(patient_df, 'date'),
+        'unit': units,
+        'status': statuses.where(statuses.isin(['HIGH', 'LOW', 'NORMAL']), '')
+    }).to_dict('records')
+    groups = group_by_category(data, norms)
+    abnormal_tests = get_abnormal_tests(data, norms)
+    charts = prepare_chart_data(data, norms)
+    return {
+        'patient_id': str(patient_id),
+        'groups': groups,
+        'abnormal_tests': abnormal_tests,
+        'charts': charts
+    }
+
+
 @router.get("/patient-data-from-uploaded")
 async def get_patient_data_from_uploaded(patient_id: str) -> Dict[str, Any]:
     """Получает данные пациента из загруженных файлов"""
-    if not UPLOADED_DATA_FILE.exists():
+    uploaded_file = get_uploaded_data_file()
+    if not uploaded_file.exists():
         raise HTTPException(status_code=404, detail="Загруженные данные не найдены")
     try:
-        df = pd.read_csv(UPLOADED_DATA_FILE)
-        patient_df = df[df['patient_id'].astype(str) == str(patient_id)]
-        if patient_df.empty:
-            raise HTTPException(status_code=404, detail=f"Пациент {patient_id} не найден в загруженных данных")
-        norms = load_norms()
-        data = []
-        for _, row in patient_df.iterrows():
-            test_code = str(row.get('test_code', ''))
-            test_name = str(row.get('test_name', '')) if 'test_name' in patient_df.columns else test_code
-            value = row.get('value', None)
-            date_value = str(row.get('date', '')) if 'date' in patient_df.columns else ''
-            unit = str(row.get('unit', '')) if 'unit' in patient_df.columns else ''
-            try:
-                float_value = float(value)
-            except:
-                continue
-            if not test_name or test_name == test_code:
-                norm_info = get_norm_info(test_code, '', norms)
-                if norm_info and norm_info.get('name'):
-                    test_name = norm_info.get('name', test_code)
-            if not unit and test_code:
-                norm_info = get_norm_info(test_code, test_name, norms)
-                if norm_info and norm_info.get('unit'):
-                    unit = norm_info.get('unit', '')
-            # Get status from CSV if available
-            status_from_csv = str(row.get('status', '')).strip().upper() if 'status' in patient_df.columns else ''
-            
-            normalized_row = {
-                'patient_id': str(patient_id),
-                'test_code': test_code,
-                'test_name': test_name,
-                'value': float_value,
-                'date': date_value,
-                'unit': unit,
-                'status': status_from_csv if status_from_csv in ['HIGH', 'LOW', 'NORMAL'] else ''
-            }
-            data.append(normalized_row)
-        groups = group_by_category(data, norms)
-        abnormal_tests = get_abnormal_tests(data, norms)
-        charts = prepare_chart_data(data, norms)
-        return {
-            'patient_id': str(patient_id),
-            'groups': groups,
-            'abnormal_tests': abnormal_tests,
-            'charts': charts
-        }
+        return await run_in_threadpool(build_patient_data_from_uploaded, uploaded_file, patient_id)
     except HTTPException:
         raise
     except Exception as e:
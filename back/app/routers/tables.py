@@ -2,11 +2,20 @@
 Роутер для работы с таблицами.
 """
 from fastapi import APIRouter, UploadFile, File, HTTPException, status
-from typing import Dict, Any, List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from pydantic import BaseModel
+from collections import OrderedDict
+import copy
+import hashlib
 import logging
 import sys
 from pathlib import Path
+import numpy as np
+import orjson
+import pandas as pd
 
 # Добавляем путь к модулям аналитики
 analytics_path = Path(__file__).parent.parent.parent / 'analytics'
@@ -15,7 +24,7 @@ sys.path.insert(0, str(analytics_path))
 from app.services.storage import (
     save_table,
     get_table as get_table_from_storage,
-    get_all_tables,
+    get_all_tables_metadata,
     delete_table as delete_table_from_storage
 )
 from app.services.analytics import process_table, get_pie_chart_data
@@ -52,7 +61,35 @@ except Exception as e:
     logger.error(f"Не удалось импортировать name_of_analysis.py: {e}")
     raise ImportError(f"Не удалось импортировать name_of_analysis.py. Убедитесь, что файл находится в back/analytics/: {e}")
 
-router = APIRouter(prefix="/api/tables", tags=["tables"])
+router = APIRouter(prefix="/api/tables", tags=["tables"], default_response_class=ORJSONResponse)
+
+# Кэш результатов обработки загруженных файлов (LRU):
+# ключ -> {table_data: копия данных таблицы, table_ids: ID таблиц, сохраненных из этой записи}.
+# Размер ограничен суммарным числом строк закэшированных таблиц
+UPLOAD_CACHE: "OrderedDict[Tuple[Any, ...], Dict[str, Any]]" = OrderedDict()
+UPLOAD_CACHE_MAX_ROWS = 200_000
+UPLOAD_CACHE_ROWS = 0
+
+# Таблицы больше этого числа строк отдаются потоком, по частям
+TABLE_STREAM_MIN_ROWS = 10_000
+TABLE_STREAM_CHUNK_ROWS = 1_000
+
+# Заглушка для референсных значений: название анализа -> (min, max)
+# В будущем это будет загружаться из JSON файла или базы данных
+REFERENCE_VALUES: Dict[str, Tuple[float, float]] = {
+    "Гемоглобин": (120, 160),
+    "Эритроциты": (4.0, 5.5),
+    "Лейкоциты": (4.0, 9.0),
+    "Тромбоциты": (150, 400),
+    "Глюкоза": (3.9, 5.9),
+    "Креатинин": (62, 106),
+    "АЛТ": (10, 40),
+    "АСТ": (10, 40),
+    "Холестерин": (3.0, 5.2),
+    "Билирубин": (3.4, 20.5)
+}
+# Границы для анализов без референсных значений
+DEFAULT_REFERENCE_RANGE: Tuple[float, float] = (0, 100)
 
 
 class ReferenceCheckRequest(BaseModel):
@@ -60,6 +97,253 @@ class ReferenceCheckRequest(BaseModel):
     test_names: List[str]
 
 
+def to_float_values(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Переводит колонку значений анализа в числа за один векторный проход.
+    
+    Args:
+        values: Значения колонки (числа, строки, None)
+        
+    Returns:
+        Маска строк с числовым значением и массив float64 со значениями
+        (результат тот же, что у float(value) для каждой непустой ячейки)
+    """
+    raw = values.to_numpy(dtype=object)
+    present = pd.notna(raw) & (raw != '')
+    numeric = present & pd.to_numeric(values, errors='coerce').notna().to_numpy()
+    result = np.full(len(raw), np.nan)
+    # Для строк float() дает точный результат, to_numeric может отличаться в последнем бите
+    result[numeric] = raw[numeric].astype('float64')
+    # Оставшиеся непустые значения (их обычно немного) проверяем как раньше - через float()
+    for position in np.flatnonzero(present & ~numeric):
+        try:
+            result[position] = float(raw[position])
+            numeric[position] = True
+        except (ValueError, TypeError):
+            logger.debug(f"Не удалось преобразовать значение '{raw[position]}' в число")
+    return numeric, result
+
+
+def build_reference_patients(
+    values: pd.Series,
+    patient_ids: Optional[pd.Series],
+    ref_min: float,
+    ref_max: float
+) -> List[Dict[str, Any]]:
+    """
+    Собирает список пациентов с числовыми значениями анализа и признаком нормы.
+    
+    Args:
+        values: Значения анализа
+        patient_ids: ID пациентов тех же строк (None - нумерация Patient_N по позиции)
+        ref_min: Нижняя граница нормы
+        ref_max: Верхняя граница нормы
+        
+    Returns:
+        Список {"patient_id", "value", "is_normal"} в порядке строк таблицы
+    """
+    mask, numbers = to_float_values(values)
+    numbers = numbers[mask]
+    is_normal = (ref_min <= numbers) & (numbers <= ref_max)
+    if patient_ids is not None:
+        ids = patient_ids.to_numpy(dtype=object)[mask]
+        ids = [str(None if pd.isna(patient_id) else patient_id) for patient_id in ids]
+    else:
+        ids = [f"Patient_{position + 1}" for position in np.flatnonzero(mask)]
+    return [
+        {"patient_id": patient_id, "value": value, "is_normal": normal}
+        for patient_id, value, normal in zip(ids, numbers.tolist(), is_normal.tolist())
+    ]
+
+
+def dump_json(value: Any) -> bytes:
+    """Сериализует значение в JSON через orjson (нестандартные типы - как в FastAPI)"""
+    return orjson.dumps(
+        value,
+        default=jsonable_encoder,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    )
+
+
+def iter_table_json(table: Dict[str, Any]) -> Iterator[bytes]:
+    """
+    Отдает JSON таблицы частями: метаданные целиком, строки data - пачками.
+    Весь ответ не собирается в памяти одной строкой.
+    
+    Args:
+        table: Данные таблицы
+        
+    Yields:
+        Части JSON документа
+    """
+    yield b'{'
+    for position, (key, value) in enumerate(table.items()):
+        prefix = (b',' if position else b'') + dump_json(key) + b':'
+        if key != 'data' or not isinstance(value, list):
+            yield prefix + dump_json(value)
+            continue
+        yield prefix + b'['
+        for start in range(0, len(value), TABLE_STREAM_CHUNK_ROWS):
+            rows = value[start:start + TABLE_STREAM_CHUNK_ROWS]
+            # Пачку строк сериализуем как массив и снимаем скобки
+            chunk = dump_json(rows)[1:-1]
+            yield (b',' if start else b'') + chunk
+        yield b']'
+    yield b'}'
+
+
+def get_names_json_path() -> Path:
+    """Путь к JSON файлу с названиями анализов (проверяем оба возможных расположения)"""
+    json_path = analytics_path / 'data.json'
+    if not json_path.exists():
+        # Пробуем альтернативный путь
+        json_path = analytics_path / 'data' / 'data.json'
+    return json_path
+
+
+def get_upload_cache_key(file_content: bytes, filename: str, file_extension: str) -> Tuple[Any, ...]:
+    """
+    Ключ кэша результата обработки файла.
+    Результат зависит от содержимого, формата, признака файла метаданных (по имени файла)
+    и версии JSON файла с названиями анализов.
+    """
+    json_path = get_names_json_path()
+    json_version = json_path.stat().st_mtime_ns if json_path.exists() else 0
+    is_metadata_file = 'metadata' in filename.lower() or 'human_immune' in filename.lower()
+    content_hash = hashlib.blake2b(file_content, digest_size=16).hexdigest()
+    return content_hash, file_extension, is_metadata_file, json_version
+
+
+def get_table_rows_count(table_data: Dict[str, Any]) -> int:
+    """Число строк таблицы (для учета размера кэша)"""
+    return len(table_data.get('data') or [])
+
+
+def remember_upload(cache_key: Tuple[Any, ...], table_data: Dict[str, Any]) -> None:
+    """Кладет копию результата обработки в кэш и вытесняет давно не использованные записи"""
+    global UPLOAD_CACHE_ROWS
+    rows_count = get_table_rows_count(table_data)
+    if rows_count > UPLOAD_CACHE_MAX_ROWS:
+        # Слишком большая таблица вытеснила бы весь кэш - не кэшируем
+        return
+    forget_upload(cache_key)
+    UPLOAD_CACHE[cache_key] = {'table_data': table_data, 'table_ids': set()}
+    UPLOAD_CACHE_ROWS += rows_count
+    while UPLOAD_CACHE_ROWS > UPLOAD_CACHE_MAX_ROWS:
+        _, evicted = UPLOAD_CACHE.popitem(last=False)
+        UPLOAD_CACHE_ROWS -= get_table_rows_count(evicted['table_data'])
+
+
+def forget_upload(cache_key: Tuple[Any, ...]) -> None:
+    """Удаляет запись из кэша результатов обработки"""
+    global UPLOAD_CACHE_ROWS
+    entry = UPLOAD_CACHE.pop(cache_key, None)
+    if entry is not None:
+        UPLOAD_CACHE_ROWS -= get_table_rows_count(entry['table_data'])
+
+
+def forget_uploaded_table(table_id: str) -> None:
+    """Удаляет из кэша запись, из которой была сохранена таблица (записей немного - ищем перебором)"""
+    for cache_key, entry in list(UPLOAD_CACHE.items()):
+        if table_id in entry['table_ids']:
+            forget_upload(cache_key)
+
+
+def process_uploaded_file(file_content: bytes, filename: str, file_extension: str) -> Dict[str, Any]:
+    """
+    Парсит файл и прогоняет его через предобработку и обогащение названиями анализов.
+    
+    Args:
+        file_content: Байты файла
+        filename: Имя файла
+        file_extension: Расширение файла (csv, json, xlsx, xls)
+        
+    Returns:
+        Данные таблицы в широком формате
+    """
+    # Парсим файл в зависимости от типа
+    if file_extension == 'csv':
+        table_data = parse_csv(file_content)
+    elif file_extension == 'json':
+        table_data = parse_json(file_content)
+    elif file_extension in ['xlsx', 'xls']:
+        table_data = parse_excel(file_content)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неподдерживаемый формат файла: {file_extension}. Поддерживаются: csv, json, xlsx, xls"
+        )
+    
+    # Добавляем метаданные о файле
+    table_data['filename'] = filename
+    table_data['file_type'] = file_extension
+    
+    # Логируем начальные данные
+    initial_rows = len(table_data.get('data', []))
+    initial_cols = len(table_data.get('columns', []))
+    logger.info(f"Парсинг завершен. Исходные данные: {initial_rows} строк, {initial_cols} колонок")
+    
+    # Шаг 1: Конвертируем в JSON формат для предобработки
+    logger.info("Конвертация данных в JSON формат для предобработки...")
+    json_format_data = wide_format_to_json_format(table_data)
+    json_patients_count = len(json_format_data.get('patients', []))
+    logger.info(f"Конвертация в JSON формат: {json_patients_count} пациентов, {len(json_format_data.get('test_names', {}))} тестов")
+    
+    # Шаг 2: Предобработка данных (удаление пустых, дубликатов, выбросов)
+    # ВАЖНО: Для Excel файлов с метаданными (human_immune_health_atlas_metadata)
+    # временно отключаем агрессивную предобработку, чтобы не потерять данные
+    is_metadata_file = 'metadata' in filename.lower() or 'human_immune' in filename.lower()
+    
+    logger.info(f"Применение предобработки данных (back.py)... (метаданные: {is_metadata_file})")
+    try:
+        # Для файлов метаданных отключаем удаление выбросов (может удалить много данных)
+        # и делаем менее агрессивную очистку
+        preprocessed_data, preprocess_stats = preprocess_json(
+            json_format_data,
+            remove_empty=not is_metadata_file,  # Для метаданных не удаляем пустые
+            remove_duplicates=True,
+            remove_outliers=not is_metadata_file  # Для метаданных не удаляем выбросы
+        )
+        preprocessed_patients_count = len(preprocessed_data.get('patients', []))
+        logger.info(f"Предобработка завершена. Осталось пациентов: {preprocessed_patients_count}")
+        logger.info(f"Статистика предобработки: {preprocess_stats}")
+    except Exception as e:
+        logger.error(f"Ошибка при предобработке данных: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при предобработке данных: {str(e)}"
+        )
+    
+    # Шаг 3: Обогащение JSON данными из JSON файла (переименование анализов)
+    logger.info("Обогащение данных названиями анализов (name_of_analysis.py)...")
+    try:
+        json_path = get_names_json_path()
+        if not json_path.exists():
+            logger.warning(f"JSON файл не найден по пути {json_path}, пропускаем обогащение")
+            enriched_data = preprocessed_data
+        else:
+            enriched_data = enrich_json_with_names(
+                preprocessed_data,
+                json_path=str(json_path),
+                similarity_threshold=0.85
+            )
+            logger.info("Обогащение данными из JSON завершено")
+    except Exception as e:
+        logger.error(f"Ошибка при обогащении данных: {e}")
+        # Продолжаем с предобработанными данными, если обогащение не удалось
+        enriched_data = preprocessed_data
+    
+    # Шаг 4: Конвертируем обратно в широкий формат
+    logger.info("Конвертация обратно в широкий формат...")
+    enriched_patients_count = len(enriched_data.get('patients', []))
+    logger.info(f"Перед конвертацией в широкий формат: {enriched_patients_count} пациентов")
+    processed_data = json_format_to_wide_format(enriched_data)
+    final_rows = len(processed_data.get('data', []))
+    final_cols = len(processed_data.get('columns', []))
+    logger.info(f"Конвертация завершена. Итоговые данные: {final_rows} строк, {final_cols} колонок")
+    return processed_data
+
+
 @router.post("/upload", status_code=status.HTTP_201_CREATED)
 async def upload_table(
     file: UploadFile = File(...)
@@ -81,91 +365,22 @@ async def upload_table(
         # Определяем тип файла по расширению
         file_extension = file.filename.split('.')[-1].lower() if file.filename else ''
         
-        # Парсим файл в зависимости от типа
-        if file_extension == 'csv':
-            table_data = parse_csv(file_content)
-        elif file_extension == 'json':
-            table_data = parse_json(file_content)
-        elif file_extension in ['xlsx', 'xls']:
-            table_data = parse_excel(file_content)
+        # Повторная загрузка того же файла (например, повтор запроса из интерфейса)
+        # не прогоняет его заново через парсинг, предобработку и обогащение
+        cache_key = get_upload_cache_key(file_content, file.filename or '', file_extension)
+        cached_entry = UPLOAD_CACHE.get(cache_key)
+        if cached_entry is not None:
+            UPLOAD_CACHE.move_to_end(cache_key)
+            processed_data = await run_in_threadpool(copy.deepcopy, cached_entry['table_data'])
+            logger.info(f"Файл {file.filename} уже обрабатывался, результат взят из кэша")
         else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Неподдерживаемый формат файла: {file_extension}. Поддерживаются: csv, json, xlsx, xls"
-            )
-        
-        # Добавляем метаданные о файле
-        table_data['filename'] = file.filename
-        table_data['file_type'] = file_extension
-        
-        # Логируем начальные данные
-        initial_rows = len(table_data.get('data', []))
-        initial_cols = len(table_data.get('columns', []))
-        logger.info(f"Парсинг завершен. Исходные данные: {initial_rows} строк, {initial_cols} колонок")
-        
-        # Шаг 1: Конвертируем в JSON формат для предобработки
-        logger.info("Конвертация данных в JSON формат для предобработки...")
-        json_format_data = wide_format_to_json_format(table_data)
-        json_patients_count = len(json_format_data.get('patients', []))
-        logger.info(f"Конвертация в JSON формат: {json_patients_count} пациентов, {len(json_format_data.get('test_names', {}))} тестов")
-        
-        # Шаг 2: Предобработка данных (удаление пустых, дубликатов, выбросов)
-        # ВАЖНО: Для Excel файлов с метаданными (human_immune_health_atlas_metadata)
-        # временно отключаем агрессивную предобработку, чтобы не потерять данные
-        is_metadata_file = 'metadata' in file.filename.lower() or 'human_immune' in file.filename.lower()
-        
-        logger.info(f"Применение предобработки данных (back.py)... (метаданные: {is_metadata_file})")
-        try:
-            # Для файлов метаданных отключаем удаление выбросов (может удалить много данных)
-            # и делаем менее агрессивную очистку
-            preprocessed_data, preprocess_stats = preprocess_json(
-                json_format_data,
-                remove_empty=not is_metadata_file,  # Для метаданных не удаляем пустые
-                remove_duplicates=True,
-                remove_outliers=not is_metadata_file  # Для метаданных не удаляем выбросы
+            # Парсинг, предобработка и обогащение - блокирующая работа, выполняем в пуле потоков,
+            # чтобы не останавливать обработку остальных запросов
+            processed_data = await run_in_threadpool(
+                process_uploaded_file, file_content, file.filename, file_extension
             )
-            preprocessed_patients_count = len(preprocessed_data.get('patients', []))
-            logger.info(f"Предобработка завершена. Осталось пациентов: {preprocessed_patients_count}")
-            logger.info(f"Статистика предобработки: {preprocess_stats}")
-        except Exception as e:
-            logger.error(f"Ошибка при предобработке данных: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Ошибка при предобработке данных: {str(e)}"
-            )
-        
-        # Шаг 3: Обогащение JSON данными из JSON файла (переименование анализов)
-        logger.info("Обогащение данных названиями анализов (name_of_analysis.py)...")
-        try:
-            # Определяем путь к JSON файлу (проверяем оба возможных расположения)
-            json_path = analytics_path / 'data.json'
-            if not json_path.exists():
-                # Пробуем альтернативный путь
-                json_path = analytics_path / 'data' / 'data.json'
-            
-            if not json_path.exists():
-                logger.warning(f"JSON файл не найден по пути {json_path}, пропускаем обогащение")
-                enriched_data = preprocessed_data
-            else:
-                enriched_data = enrich_json_with_names(
-                    preprocessed_data,
-                    json_path=str(json_path),
-                    similarity_threshold=0.85
-                )
-                logger.info("Обогащение данными из JSON завершено")
-        except Exception as e:
-            logger.error(f"Ошибка при обогащении данных: {e}")
-            # Продолжаем с предобработанными данными, если обогащение не удалось
-            enriched_data = preprocessed_data
-        
-        # Шаг 4: Конвертируем обратно в широкий формат
-        logger.info("Конвертация обратно в широкий формат...")
-        enriched_patients_count = len(enriched_data.get('patients', []))
-        logger.info(f"Перед конвертацией в широкий формат: {enriched_patients_count} пациентов")
-        processed_data = json_format_to_wide_format(enriched_data)
-        final_rows = len(processed_data.get('data', []))
-        final_cols = len(processed_data.get('columns', []))
-        logger.info(f"Конвертация завершена. Итоговые данные: {final_rows} строк, {final_cols} колонок")
+            # В кэш кладем копию: processed_data дальше изменяется (метаданные, id) и сохраняется в хранилище
+            remember_upload(cache_key, await run_in_threadpool(copy.deepcopy, processed_data))
         
         # Сохраняем метаданные о файле
         processed_data['filename'] = file.filename
@@ -174,8 +389,12 @@ async def upload_table(
         # Отправляем в аналитику (заглушка)
         processed_data = process_table(processed_data)
         
-        # Сохраняем в хранилище
-        table_id = save_table(processed_data)
+        # Сохраняем в хранилище (запись на диск - в пуле потоков)
+        table_id = await run_in_threadpool(save_table, processed_data)
+        # Запись кэша могла быть вытеснена, пока таблица сохранялась
+        cached_entry = UPLOAD_CACHE.get(cache_key)
+        if cached_entry is not None:
+            cached_entry['table_ids'].add(table_id)
         
         logger.info(f"Таблица загружена: {table_id}, файл: {file.filename}")
         
@@ -210,20 +429,8 @@ async def list_tables() -> Dict[str, Any]:
     Returns:
         Список всех таблиц с их метаданными
     """
-    all_tables = get_all_tables()
-    
     # Возвращаем только метаданные, без полных данных
-    tables_list = []
-    for table_id, table_data in all_tables.items():
-        tables_list.append({
-            "table_id": table_id,
-            "filename": table_data.get('filename', 'Unknown'),
-            "file_type": table_data.get('file_type', 'Unknown'),
-            "shape": table_data.get('shape'),
-            "columns": table_data.get('columns'),
-            "created_at": table_data.get('created_at'),
-            "updated_at": table_data.get('updated_at')
-        })
+    tables_list = get_all_tables_metadata()
     
     return {
         "count": len(tables_list),
@@ -232,7 +439,7 @@ async def list_tables() -> Dict[str, Any]:
 
 
 @router.get("/{table_id}")
-async def get_table(table_id: str) -> Dict[str, Any]:
+async def get_table(table_id: str) -> Response:
     """
     Получает таблицу по ID.
     
@@ -240,9 +447,9 @@ async def get_table(table_id: str) -> Dict[str, Any]:
         table_id: ID таблицы
         
     Returns:
-        Данные таблицы
+        Данные таблицы (большие таблицы отдаются потоком)
     """
-    table = get_table_from_storage(table_id)
+    table = await run_in_threadpool(get_table_from_storage, table_id)
     
     if not table:
         raise HTTPException(
@@ -250,7 +457,9 @@ async def get_table(table_id: str) -> Dict[str, Any]:
             detail=f"Таблица с ID {table_id} не найдена"
         )
     
-    return table
+    if len(table.get('data') or []) > TABLE_STREAM_MIN_ROWS:
+        return StreamingResponse(iter_table_json(table), media_type="application/json")
+    return Response(dump_json(table), media_type="application/json")
 
 
 @router.delete("/{table_id}")
@@ -264,7 +473,10 @@ async def delete_table(table_id: str) -> Dict[str, str]:
     Returns:
         Сообщение об успешном удалении
     """
-    deleted = delete_table_from_storage(table_id)
+    deleted = await run_in_threadpool(delete_table_from_storage, table_id)
+    
+    # Результат обработки удаленной таблицы больше не держим в кэше
+    forget_uploaded_table(table_id)
     
     if not deleted:
         raise HTTPException(
@@ -294,7 +506,7 @@ async def get_pie_chart(table_id: str) -> Dict[str, Any]:
         }
     """
     # Получаем таблицу из хранилища
-    table = get_table_from_storage(table_id)
+    table = await run_in_threadpool(get_table_from_storage, table_id)
     
     if not table:
         raise HTTPException(
@@ -310,58 +522,23 @@ async def get_pie_chart(table_id: str) -> Dict[str, Any]:
     return chart_data
 
 
-@router.post("/{table_id}/reference-check")
-async def check_reference_values(
+def check_table_reference_values(
     table_id: str,
-    request: ReferenceCheckRequest
+    table: Dict[str, Any],
+    requested_tests: List[str]
 ) -> Dict[str, Any]:
     """
-    Проверяет соответствие значений анализов референсным значениям.
+    Сопоставляет значения анализов таблицы с референсными значениями.
+    Блокирующая работа (чтение данных и преобразование значений) - вызывается в пуле потоков.
     
     Args:
-        table_id: ID таблицы
-        request: Запрос с списком названий анализов для проверки
+        table_id: ID таблицы (для логов)
+        table: Данные таблицы
+        requested_tests: Названия анализов для проверки
         
     Returns:
-        Данные для построения графиков с референсными значениями:
-        {
-            "test_name": {
-                "reference_min": float,
-                "reference_max": float,
-                "patients": [
-                    {
-                        "patient_id": str,
-                        "value": float,
-                        "is_normal": bool
-                    }
-                ]
-            }
-        }
+        Результат проверки в формате ответа check_reference_values
     """
-    # Получаем таблицу из хранилища
-    table = get_table_from_storage(table_id)
-    
-    if not table:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Таблица с ID {table_id} не найдена"
-        )
-    
-    # Заглушка для референсных значений
-    # В будущем это будет загружаться из JSON файла или базы данных
-    reference_values = {
-        "Гемоглобин": {"min": 120, "max": 160},
-        "Эритроциты": {"min": 4.0, "max": 5.5},
-        "Лейкоциты": {"min": 4.0, "max": 9.0},
-        "Тромбоциты": {"min": 150, "max": 400},
-        "Глюкоза": {"min": 3.9, "max": 5.9},
-        "Креатинин": {"min": 62, "max": 106},
-        "АЛТ": {"min": 10, "max": 40},
-        "АСТ": {"min": 10, "max": 40},
-        "Холестерин": {"min": 3.0, "max": 5.2},
-        "Билирубин": {"min": 3.4, "max": 20.5}
-    }
-    
     # Получаем данные таблицы
     columns = table.get('columns', [])
     data = table.get('data', [])
@@ -370,7 +547,13 @@ async def check_reference_values(
     # Определяем формат данных: широкий (wide) или длинный (long)
     # Длинный формат: есть колонки test_name, value, patient_id
     # Широкий формат: каждая колонка - это анализ
-    is_long_format = 'test_name' in columns or 'test' in [col.lower() for col in columns]
+    # Поиск колонок - по словарю "название в нижнем регистре -> первая такая колонка",
+    # построенному один раз на запрос, а не перебором колонок для каждого анализа
+    column_set = set(columns)
+    column_by_lower = {}
+    for col in columns:
+        column_by_lower.setdefault(col.lower(), col)
+    is_long_format = 'test_name' in column_set or 'test' in column_by_lower
     
     # Создаем обратный маппинг test_name -> test_code для нового формата
     test_name_to_code = {v: k for k, v in test_names.items()} if test_names else {}
@@ -401,46 +584,25 @@ async def check_reference_values(
                 detail="Таблица в длинном формате, но не найдены колонки test_name или value"
             )
         
-        # Группируем данные по названиям анализов
-        for requested_test_name in request.test_names:
+        # Таблицу переводим в колонки один раз и группируем строки по названию анализа
+        # (совпадение регистронезависимое, поэтому ключ - название в нижнем регистре)
+        needed_columns = [test_name_col, value_col] + ([patient_id_col] if patient_id_col else [])
+        df = pd.DataFrame(data, columns=needed_columns, dtype=object)
+        test_name_keys = df[test_name_col].map(lambda name: name.lower() if isinstance(name, str) and name else None)
+        rows_by_test_name = df.groupby(test_name_keys, sort=False).indices
+        
+        for requested_test_name in requested_tests:
             # Получаем референсные значения
-            ref_min = reference_values.get(requested_test_name, {}).get("min", 0)
-            ref_max = reference_values.get(requested_test_name, {}).get("max", 100)
-            
-            patients_data = []
+            ref_min, ref_max = REFERENCE_VALUES.get(requested_test_name, DEFAULT_REFERENCE_RANGE)
             
-            # Ищем все строки с этим названием анализа
-            for row in data:
-                row_test_name = row.get(test_name_col)
-                
-                # Проверяем совпадение (точное или регистронезависимое)
-                if not row_test_name or (row_test_name != requested_test_name and row_test_name.lower() != requested_test_name.lower()):
-                    continue
-                
-                value = row.get(value_col)
-                
-                # Пропускаем пустые значения
-                if value is None or value == '':
-                    continue
-                
-                try:
-                    # Пытаемся преобразовать в число
-                    num_value = float(value)
-                    
-                    # Проверяем, в пределах ли нормы
-                    is_normal = ref_min <= num_value <= ref_max
-                    
-                    patient_id = row.get(patient_id_col) if patient_id_col else "Unknown"
-                    
-                    patients_data.append({
-                        "patient_id": str(patient_id),
-                        "value": num_value,
-                        "is_normal": is_normal
-                    })
-                except (ValueError, TypeError) as e:
-                    # Если не число, пропускаем
-                    logger.debug(f"Не удалось преобразовать значение '{value}' в число для анализа {requested_test_name}: {e}")
-                    continue
+            # Все строки с этим названием анализа
+            positions = rows_by_test_name.get(requested_test_name.lower())
+            if positions is None:
+                logger.warning(f"Не найдено данных пациентов для анализа {requested_test_name}")
+                continue
+            test_rows = df.iloc[positions]
+            patient_ids = test_rows[patient_id_col] if patient_id_col else pd.Series("Unknown", index=test_rows.index)
+            patients_data = build_reference_patients(test_rows[value_col], patient_ids, ref_min, ref_max)
             
             # Добавляем результат только если есть данные пациентов
             if patients_data:
@@ -454,14 +616,24 @@ async def check_reference_values(
     
     else:
         # Работаем с широким форматом данных (каждая колонка - анализ)
-        for requested_test in request.test_names:
+        # Ищем колонку с ID пациента (может быть patient_id, id, Patient ID и т.д.)
+        patient_id_col = None
+        for col in columns:
+            if col.lower() in ['patient_id', 'id', 'patient id', 'пациент']:
+                patient_id_col = col
+                break
+        
+        # Сначала сопоставляем запрошенные анализы с колонками:
+        # не найденные в таблице анализы отсекаются до чтения данных
+        known_tests = []  # [(test_code, display_test_name)]
+        for requested_test in requested_tests:
             # Проверяем, это test_code или test_name
             # Сначала проверяем, есть ли это test_code (название колонки)
             test_code = None
             display_test_name = requested_test  # Для отображения в результате
             
             # 1. Проверяем точное совпадение с названием колонки (test_code)
-            if requested_test in columns:
+            if requested_test in column_set:
                 test_code = requested_test
                 # Если есть test_names, получаем человекочитаемое название
                 if test_names and test_code in test_names:
@@ -472,68 +644,42 @@ async def check_reference_values(
                 test_code = test_name_to_code[requested_test]
                 display_test_name = requested_test
             # 3. Ищем по регистронезависимому совпадению в колонках
-            else:
-                for col in columns:
-                    if col.lower() == requested_test.lower():
-                        test_code = col
-                        # Если есть test_names, получаем человекочитаемое название
-                        if test_names and test_code in test_names:
-                            display_test_name = test_names[test_code]
-                        else:
-                            display_test_name = requested_test
-                        break
+            elif requested_test.lower() in column_by_lower:
+                test_code = column_by_lower[requested_test.lower()]
+                # Если есть test_names, получаем человекочитаемое название
+                if test_names and test_code in test_names:
+                    display_test_name = test_names[test_code]
+                else:
+                    display_test_name = requested_test
             
             if not test_code:
                 logger.warning(f"Анализ '{requested_test}' не найден в таблице. Доступные колонки: {columns[:10]}")
                 # Продолжаем, но не добавляем в результат
                 continue
             
+            known_tests.append((test_code, display_test_name))
+        
+        # Таблицу переводим в колонки один раз: только колонки найденных анализов и колонка ID
+        # (если ни один анализ не найден, данные таблицы не читаются)
+        if known_tests:
+            needed_columns = list(dict.fromkeys(
+                [test_code for test_code, _ in known_tests] + ([patient_id_col] if patient_id_col else [])
+            ))
+            df = pd.DataFrame(data, columns=needed_columns, dtype=object)
+            # Колонка ID; если ID нет, используем индекс строки
+            patient_ids = df[patient_id_col] if patient_id_col else None
+        
+        for test_code, display_test_name in known_tests:
             # Используем test_code для поиска в данных (это название колонки)
             # Но в результате используем display_test_name для отображения
             
             # Получаем референсные значения
             # Проверяем сначала по display_test_name, потом по test_code
-            ref_min = reference_values.get(display_test_name, {}).get("min") or \
-                     reference_values.get(test_code, {}).get("min") or 0
-            ref_max = reference_values.get(display_test_name, {}).get("max") or \
-                     reference_values.get(test_code, {}).get("max") or 100
+            ref_min, ref_max = REFERENCE_VALUES.get(display_test_name) or \
+                REFERENCE_VALUES.get(test_code, DEFAULT_REFERENCE_RANGE)
             
             # Собираем данные пациентов для этого анализа
-            patients_data = []
-            patient_id_col = None
-            
-            # Ищем колонку с ID пациента (может быть patient_id, id, Patient ID и т.д.)
-            for col in columns:
-                if col.lower() in ['patient_id', 'id', 'patient id', 'пациент']:
-                    patient_id_col = col
-                    break
-            
-            # Если не нашли колонку с ID, используем индекс строки
-            for idx, row in enumerate(data):
-                value = row.get(test_code)  # Используем test_code для поиска значения
-                
-                # Пропускаем пустые значения
-                if value is None or value == '':
-                    continue
-                
-                try:
-                    # Пытаемся преобразовать в число
-                    num_value = float(value)
-                    
-                    # Проверяем, в пределах ли нормы
-                    is_normal = ref_min <= num_value <= ref_max
-                    
-                    patient_id = row.get(patient_id_col) if patient_id_col else f"Patient_{idx + 1}"
-                    
-                    patients_data.append({
-                        "patient_id": str(patient_id),
-                        "value": num_value,
-                        "is_normal": is_normal
-                    })
-                except (ValueError, TypeError) as e:
-                    # Если не число, пропускаем
-                    logger.debug(f"Не удалось преобразовать значение '{value}' в число для анализа {test_code}: {e}")
-                    continue
+            patients_data = build_reference_patients(df[test_code], patient_ids, ref_min, ref_max)
             
             # Добавляем результат только если есть данные пациентов
             # Используем display_test_name для ключа в результате
@@ -546,10 +692,52 @@ async def check_reference_values(
             else:
                 logger.warning(f"Не найдено данных пациентов для анализа {test_code} ({display_test_name})")
     
-    logger.info(f"Проверка референсных значений выполнена для таблицы {table_id}, анализов: {len(request.test_names)}, найдено: {len(result)}")
+    logger.info(f"Проверка референсных значений выполнена для таблицы {table_id}, анализов: {len(requested_tests)}, найдено: {len(result)}")
     
     if not result:
-        logger.warning(f"Не найдено данных ни для одного из запрошенных анализов: {request.test_names}")
+        logger.warning(f"Не найдено данных ни для одного из запрошенных анализов: {requested_tests}")
         logger.info(f"Доступные колонки в таблице: {columns}")
     
     return result
+
+
+@router.post("/{table_id}/reference-check")
+async def check_reference_values(
+    table_id: str,
+    request: ReferenceCheckRequest
+) -> Dict[str, Any]:
+    """
+    Проверяет соответствие значений анализов референсным значениям.
+    
+    Args:
+        table_id: ID таблицы
+        request: Запрос с списком названий анализов для проверки
+        
+    Returns:
+        Данные для построения графиков с референсными значениями:
+        {
+            "test_name": {
+                "reference_min": float,
+                "reference_max": float,
+                "patients": [
+                    {
+                        "patient_id": str,
+                        "value": float,
+                        "is_normal": bool
+                    }
+                ]
+            }
+        }
+    """
+    # Получаем таблицу из хранилища
+    table = await run_in_threadpool(get_table_from_storage, table_id)
+    
+    if not table:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Таблица с ID {table_id} не найдена"
+        )
+    
+    # Проверка значений - блокирующая работа, выполняем в пуле потоков,
+    # чтобы большие таблицы не останавливали обработку остальных запросов
+    return await run_in_threadpool(check_table_reference_values, table_id, table, request.test_names)
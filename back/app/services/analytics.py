@@ -12,28 +12,28 @@ def process_table(table_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Обрабатывает таблицу через аналитику (заглушка).
     
+    Таблица изменяется на месте (без копирования): вызывающий код владеет словарем
+    и сразу передает результат дальше.
+    
     Args:
         table_data: Данные таблицы
         
     Returns:
-        Обработанные данные таблицы (пока возвращает те же данные)
+        Тот же словарь таблицы с отметкой об обработке в metadata
     """
     logger.info("Отправка таблицы в аналитику (заглушка)")
     
     # Заглушка: просто возвращаем те же данные
     # В будущем здесь будет реальная интеграция с аналитикой
-    processed_data = table_data.copy()
-    
     # Можно добавить метаданные о том, что данные обработаны
-    if 'metadata' not in processed_data:
-        processed_data['metadata'] = {}
-    
-    processed_data['metadata']['analytics_processed'] = True
-    processed_data['metadata']['analytics_status'] = 'stub'
+    table_data.setdefault('metadata', {}).update({
+        'analytics_processed': True,
+        'analytics_status': 'stub'
+    })
     
     logger.info("Получение результата из аналитики (заглушка)")
     
-    return processed_data
+    return table_data
 
 
 def get_pie_chart_data(table_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -1,13 +1,115 @@
 """
-Глобальное хранилище для таблиц в памяти.
+Хранилище таблиц.
 Используется вместо базы данных.
+
+Таблицы записываются на диск при каждом сохранении (pickle, по файлу на таблицу),
+а в памяти держится ограниченное число последних использованных таблиц (LRU).
+Метаданные всех таблиц хранятся отдельным индексом, поэтому список таблиц
+не требует чтения самих таблиц. После перезапуска таблицы доступны без повторной загрузки.
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
 from datetime import datetime
-import uuid
+from pathlib import Path
+import logging
+import os
+import pickle
+import secrets
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Директория с таблицами: back/data/tables (в Docker - /app/data/tables, смонтированный том)
+TABLES_DIR = Path(__file__).parent.parent.parent / "data" / "tables"
+TABLES_INDEX_FILE = TABLES_DIR / "metadata.pickle"
+
+# Сколько таблиц держать в памяти (остальные читаются с диска по запросу)
+STORAGE_CACHE_SIZE = 50
+
+# Глобальное хранилище кэша (капсом): последние использованные таблицы
+STORAGE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+# Метаданные всех сохраненных таблиц: {table_id: {filename, file_type, shape, columns, created_at, updated_at}}
+TABLES_METADATA: Dict[str, Dict[str, Any]] = {}
+
+# Изменение словарей выполняется под блокировкой. Сериализация и чтение/запись файлов таблиц
+# идут вне ее, чтобы сохранение большой таблицы не останавливало остальные запросы
+STORAGE_LOCK = threading.RLock()
+
+# Запись индекса на диск: снимок индекса берется и записывается по очереди,
+# поэтому последним на диск попадает самый свежий снимок
+TABLES_INDEX_LOCK = threading.Lock()
+
+
+def get_table_path(table_id: str) -> Path:
+    """Путь к файлу таблицы на диске"""
+    return TABLES_DIR / f"{table_id}.pickle"
+
+
+def write_pickle(path: Path, value: Any) -> None:
+    """Записывает значение через временный файл и замену, чтобы не оставить файл недописанным"""
+    TABLES_DIR.mkdir(parents=True, exist_ok=True)
+    # Уникальное имя временного файла: одновременные записи одного файла не мешают друг другу
+    temp_file = path.with_name(f"{path.name}.{secrets.token_hex(4)}.tmp")
+    try:
+        with open(temp_file, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, path)
+    finally:
+        temp_file.unlink(missing_ok=True)
+
+
+def build_table_metadata(table_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Метаданные таблицы для индекса"""
+    return {
+        "filename": table_data.get('filename', 'Unknown'),
+        "file_type": table_data.get('file_type', 'Unknown'),
+        "shape": table_data.get('shape'),
+        "columns": table_data.get('columns'),
+        "created_at": table_data.get('created_at'),
+        "updated_at": table_data.get('updated_at')
+    }
+
 
-# Глобальное хранилище кэша (капсом)
-STORAGE: Dict[str, Dict[str, Any]] = {}
+def load_tables_index() -> Dict[str, Dict[str, Any]]:
+    """Загружает индекс метаданных таблиц с диска (пустой, если индекса нет или он поврежден)"""
+    if not TABLES_INDEX_FILE.exists():
+        return {}
+    try:
+        with open(TABLES_INDEX_FILE, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать индекс таблиц {TABLES_INDEX_FILE}: {e}")
+        return {}
+
+
+def remember_table(table_id: str, table_data: Dict[str, Any]) -> None:
+    """Кладет таблицу в память и вытесняет давно не использованные"""
+    STORAGE[table_id] = table_data
+    STORAGE.move_to_end(table_id)
+    while len(STORAGE) > STORAGE_CACHE_SIZE:
+        STORAGE.popitem(last=False)
+
+
+def write_tables_index() -> None:
+    """Записывает на диск текущий индекс метаданных таблиц"""
+    with TABLES_INDEX_LOCK:
+        with STORAGE_LOCK:
+            index_snapshot = dict(TABLES_METADATA)
+        write_pickle(TABLES_INDEX_FILE, index_snapshot)
+
+
+def write_table(table_id: str, table_data: Dict[str, Any]) -> None:
+    """Записывает таблицу и обновленный индекс на диск и кладет таблицу в память"""
+    # Таблица пишется на диск без блокировки, под ней только обновляются словари
+    write_pickle(get_table_path(table_id), table_data)
+    with STORAGE_LOCK:
+        TABLES_METADATA[table_id] = build_table_metadata(table_data)
+        remember_table(table_id, table_data)
+    write_tables_index()
+
+
+TABLES_METADATA.update(load_tables_index())
 
 
 def save_table(table_data: Dict[str, Any]) -> str:
@@ -20,10 +122,10 @@ def save_table(table_data: Dict[str, Any]) -> str:
     Returns:
         ID сохраненной таблицы
     """
-    table_id = str(uuid.uuid4())
+    table_id = secrets.token_hex(16)
     table_data['id'] = table_id
     table_data['created_at'] = datetime.now().isoformat()
-    STORAGE[table_id] = table_data
+    write_table(table_id, table_data)
     return table_id
 
 
@@ -37,17 +139,45 @@ def get_table(table_id: str) -> Optional[Dict[str, Any]]:
     Returns:
         Данные таблицы или None, если не найдена
     """
-    return STORAGE.get(table_id)
+    with STORAGE_LOCK:
+        table_data = STORAGE.get(table_id)
+        if table_data is not None:
+            STORAGE.move_to_end(table_id)
+            return table_data
+        if table_id not in TABLES_METADATA:
+            return None
+
+    # Таблицы нет в памяти - читаем с диска (без блокировки)
+    try:
+        with open(get_table_path(table_id), 'rb') as f:
+            table_data = pickle.load(f)
+    except Exception as e:
+        logger.error(f"Не удалось прочитать таблицу {table_id} с диска: {e}")
+        return None
 
+    with STORAGE_LOCK:
+        # Пока таблица читалась, ее могли удалить или сохранить заново
+        if table_id not in TABLES_METADATA:
+            return None
+        if table_id in STORAGE:
+            STORAGE.move_to_end(table_id)
+            return STORAGE[table_id]
+        remember_table(table_id, table_data)
+    return table_data
 
-def get_all_tables() -> Dict[str, Dict[str, Any]]:
+
+def get_all_tables_metadata() -> List[Dict[str, Any]]:
     """
-    Получает все таблицы.
+    Получает метаданные всех таблиц из индекса, не читая данные таблиц.
     
     Returns:
-        Словарь всех таблиц
+        Список метаданных таблиц (ID, файл, размер, колонки, даты)
     """
-    return STORAGE.copy()
+    with STORAGE_LOCK:
+        return [
+            {"table_id": table_id, **metadata}
+            for table_id, metadata in TABLES_METADATA.items()
+        ]
 
 
 def delete_table(table_id: str) -> bool:
@@ -60,10 +190,13 @@ def delete_table(table_id: str) -> bool:
     Returns:
         True если удалена, False если не найдена
     """
-    if table_id in STORAGE:
-        del STORAGE[table_id]
-        return True
-    return False
+    with STORAGE_LOCK:
+        STORAGE.pop(table_id, None)
+        if TABLES_METADATA.pop(table_id, None) is None:
+            return False
+    write_tables_index()
+    get_table_path(table_id).unlink(missing_ok=True)
+    return True
 
 
 def update_table(table_id: str, table_data: Dict[str, Any]) -> bool:
@@ -77,12 +210,13 @@ def update_table(table_id: str, table_data: Dict[str, Any]) -> bool:
     Returns:
         True если обновлена, False если не найдена
     """
-    if table_id in STORAGE:
-        table_data['id'] = table_id
-        table_data['updated_at'] = datetime.now().isoformat()
-        if 'created_at' not in table_data:
-            table_data['created_at'] = STORAGE[table_id].get('created_at')
-        STORAGE[table_id] = table_data
-        return True
-    return False
-
+    with STORAGE_LOCK:
+        existing = TABLES_METADATA.get(table_id)
+    if existing is None:
+        return False
+    table_data['id'] = table_id
+    table_data['updated_at'] = datetime.now().isoformat()
+    if 'created_at' not in table_data:
+        table_data['created_at'] = existing.get('created_at')
+    write_table(table_id, table_data)
+    return True
@@ -1,14 +1,31 @@
 """
 Утилиты для парсинга файлов (CSV, JSON, Excel).
 """
+import numpy as np
+import orjson
 import pandas as pd
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from io import BytesIO
+import importlib.util
 import logging
 
+# Движок pandas.read_excel(engine='calamine'): сам модуль не импортируем, только проверяем наличие
+CALAMINE_AVAILABLE = importlib.util.find_spec('python_calamine') is not None
+
 logger = logging.getLogger(__name__)
 
+# Сигнатуры Excel файлов: xlsx - zip архив, xls - составной документ OLE2
+EXCEL_SIGNATURES = (
+    (b'PK\x03\x04', 'openpyxl'),
+    (b'\xd0\xcf\x11\xe0', 'xlrd'),
+)
+
+# Названия колонок (в нижнем регистре) для определения структуры широкой таблицы
+LONG_FORMAT_INDICATORS = frozenset(['test_name', 'test', 'analysis', 'анализ', 'value', 'значение'])
+PATIENT_ID_COLUMN_NAMES = frozenset(['patient_id', 'id', 'patient id', 'пациент', 'subject_id', 'subject.subjectguid'])
+DATE_COLUMN_NAMES = frozenset(['date', 'дата'])
+
 
 def parse_csv(file_content: bytes) -> Dict[str, Any]:
     """
@@ -43,9 +60,13 @@ def parse_json(file_content: bytes) -> Dict[str, Any]:
         Словарь с данными таблицы
     """
     try:
-        # Пробуем декодировать как JSON
-        json_str = file_content.decode('utf-8')
-        data = json.loads(json_str)
+        # Пробуем декодировать как JSON (orjson разбирает байты напрямую, без decode)
+        try:
+            data = orjson.loads(file_content)
+        except orjson.JSONDecodeError:
+            # Стандартный json принимает то, что orjson отвергает (NaN, Infinity, очень большие целые)
+            json_str = file_content.decode('utf-8')
+            data = json.loads(json_str)
         
         # Проверяем, это новый формат с test_names и patients?
         if isinstance(data, dict) and 'test_names' in data and 'patients' in data:
@@ -75,6 +96,27 @@ def parse_json(file_content: bytes) -> Dict[str, Any]:
         raise ValueError(f"Не удалось распарсить JSON файл: {str(e)}")
 
 
+def normalize_test_names(test_names: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Приводит test_names к простому формату {test_code: name}.
+    
+    Значения вида {name: "...", unit: "..."} заменяются на name (или test_code, если name нет).
+    Если таких значений нет, словарь уже в простом формате и возвращается без копирования.
+    
+    Args:
+        test_names: Словарь тестов
+        
+    Returns:
+        Словарь {test_code: name}
+    """
+    if not any(isinstance(name_data, dict) for name_data in test_names.values()):
+        return test_names
+    return {
+        test_code: name_data.get('name', test_code) if isinstance(name_data, dict) else name_data
+        for test_code, name_data in test_names.items()
+    }
+
+
 def parse_new_json_format(data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Парсит новый формат JSON со структурой:
@@ -111,66 +153,88 @@ def parse_new_json_format(data: Dict[str, Any]) -> Dict[str, Any]:
             'shape': {'rows': 0, 'columns': 2}
         }
     
-    # Собираем все возможные test_code из всех пациентов и из test_names
-    all_test_codes = set()
-    for patient in patients:
-        analyses = patient.get('analyses', {})
-        all_test_codes.update(analyses.keys())
-    # Добавляем также все из test_names (на случай если у пациентов нет данных)
-    all_test_codes.update(test_names.keys())
+    # Преобразуем пациентов в колонки таблицы за один проход по анализам:
+    # колонка анализа создается при первой встрече test_code и заранее заполнена
+    # пустыми значениями (у пациента нет этого анализа), заполняем только имеющиеся анализы.
+    # Все test_code из test_names тоже получают колонку (на случай если у пациентов нет данных)
+    test_values = {test_code: [None] * len(patients) for test_code in test_names}
+    
+    for row_idx, patient in enumerate(patients):
+        # Используем test_code из test_names или сам test_code как название колонки
+        for test_code, analysis in patient.get('analyses', {}).items():
+            values = test_values.get(test_code)
+            if values is None:
+                values = test_values[test_code] = [None] * len(patients)
+            # Сохраняем только value, unit и status можно получить отдельно при необходимости
+            # Для совместимости с фронтендом сохраняем value
+            values[row_idx] = analysis.get('value')
     
     # Сортируем test_code для консистентности
-    sorted_test_codes = sorted(list(all_test_codes))
+    sorted_test_codes = sorted(test_values)
     
     # Создаем колонки: patient_id, date, затем все test_code
     columns = ['patient_id', 'date'] + sorted_test_codes
     
-    # Преобразуем пациентов в строки таблицы
-    rows = []
-    for patient in patients:
-        patient_id = patient.get('patient_id', '')
-        date = patient.get('date', '')
-        analyses = patient.get('analyses', {})
-        
-        # Создаем строку данных
-        row = {
-            'patient_id': patient_id,
-            'date': date
-        }
-        
-        # Добавляем значения анализов
-        # Используем test_code из test_names или сам test_code как название колонки
-        for test_code in sorted_test_codes:
-            if test_code in analyses:
-                analysis = analyses[test_code]
-                # Сохраняем только value, unit и status можно получить отдельно при необходимости
-                # Для совместимости с фронтендом сохраняем value
-                row[test_code] = analysis.get('value')
-            else:
-                # У пациента нет этого анализа - пустое значение
-                row[test_code] = None
-        
-        rows.append(row)
+    column_data = {
+        'patient_id': [patient.get('patient_id', '') for patient in patients],
+        'date': [patient.get('date', '') for patient in patients]
+    }
+    for test_code in sorted_test_codes:
+        column_data[test_code] = test_values[test_code]
     
-    # Создаем DataFrame
-    df = pd.DataFrame(rows, columns=columns)
+    # Без общего DataFrame: тип каждой колонки выводит pandas (как при создании DataFrame),
+    # а строки собираем из готовых колонок
+    column_series = {col: pd.Series(values) for col, values in column_data.items()}
+    column_values = [column_to_list(column_series[col]) for col in columns]
     
     # Нормализуем test_names: сохраняем простой формат {test_code: "name"}
     # ВАЖНО: Формат должен быть простым - {test_code: name} (строка)
-    normalized_test_names = {}
-    for test_code, name_data in test_names.items():
-        if isinstance(name_data, dict):
-            # Формат {name: "...", unit: "..."} - извлекаем только name
-            normalized_test_names[test_code] = name_data.get('name', test_code)
-        else:
-            # Простой формат: строка - сохраняем как есть
-            normalized_test_names[test_code] = name_data
+    normalized_test_names = normalize_test_names(test_names)
     
     # Сохраняем test_names в метаданные для последующего использования
-    result = dataframe_to_dict(df)
-    result['test_names'] = normalized_test_names  # Сохраняем простой формат
-    
-    return result
+    return {
+        'data': [dict(zip(columns, row)) for row in zip(*column_values)],
+        'columns': columns,
+        'dtypes': {col: str(column_series[col].dtype) for col in columns},
+        'shape': {
+            'rows': len(patients),
+            'columns': len(columns)
+        },
+        'test_names': normalized_test_names  # Сохраняем простой формат
+    }
+
+
+def detect_excel_engine(file_content: bytes) -> Optional[str]:
+    """Движок pandas для Excel файла по первым байтам (None - формат не распознан)"""
+    for signature, engine in EXCEL_SIGNATURES:
+        if file_content.startswith(signature):
+            return engine
+    return None
+
+
+def has_whitespace_only_headers(file_content: bytes, df: pd.DataFrame, detected_engine: Optional[str]) -> bool:
+    """
+    Есть ли в строке заголовка Excel ячейки только из пробелов (calamine читает их как пустые).
+    Строку заголовка перечитываем движком openpyxl/xlrd, только если calamine вернул пустые
+    заголовки - колонки "Unnamed: <i>" на своей позиции i; иначе проверка ничего не стоит.
+    """
+    placeholder_columns = [
+        position for position, col in enumerate(df.columns)
+        if col == f"Unnamed: {position}"
+    ]
+    if not placeholder_columns:
+        return False
+    try:
+        header = pd.read_excel(
+            BytesIO(file_content), engine=detected_engine or 'openpyxl', header=None, nrows=1
+        ).iloc[0].tolist()
+    except Exception as e:
+        logger.debug(f"Не удалось перечитать заголовок Excel: {e}")
+        return False
+    return any(
+        position < len(header) and isinstance(header[position], str) and not header[position].strip()
+        for position in placeholder_columns
+    )
 
 
 def parse_excel(file_content: bytes) -> Dict[str, Any]:
@@ -188,21 +252,37 @@ def parse_excel(file_content: bytes) -> Dict[str, Any]:
     
     try:
         # Читаем Excel файл
-        # Пробуем разные движки для совместимости
-        try:
-            df = pd.read_excel(BytesIO(file_content), engine='openpyxl')
-            logger.info(f"Excel файл прочитан с движком openpyxl: {df.shape[0]} строк, {df.shape[1]} колонок")
-        except Exception as e1:
-            logger.warning(f"Не удалось прочитать с openpyxl: {e1}")
-            # Если openpyxl не работает, пробуем xlrd (для старых .xls)
+        # Пробуем разные движки для совместимости: openpyxl, затем xlrd (для старых .xls).
+        # Движок, подходящий по сигнатуре файла, пробуем первым - старые .xls не проходят
+        # через заведомо неудачную попытку openpyxl. calamine (если установлен) читает оба формата быстрее
+        engines = ['openpyxl', 'xlrd']
+        detected_engine = detect_excel_engine(file_content)
+        if detected_engine:
+            engines.remove(detected_engine)
+            engines.insert(0, detected_engine)
+        if CALAMINE_AVAILABLE:
+            engines.insert(0, 'calamine')
+        
+        df = None
+        for engine in engines:
             try:
-                df = pd.read_excel(BytesIO(file_content), engine='xlrd')
-                logger.info(f"Excel файл прочитан с движком xlrd: {df.shape[0]} строк, {df.shape[1]} колонок")
-            except Exception as e2:
-                logger.warning(f"Не удалось прочитать с xlrd: {e2}")
-                # Последняя попытка - без указания движка
-                df = pd.read_excel(BytesIO(file_content))
-                logger.info(f"Excel файл прочитан без указания движка: {df.shape[0]} строк, {df.shape[1]} колонок")
+                df = pd.read_excel(BytesIO(file_content), engine=engine)
+                if engine == 'calamine' and has_whitespace_only_headers(file_content, df, detected_engine):
+                    # calamine читает заголовок из пробелов как пустую ячейку, и pandas называет колонку
+                    # "Unnamed: <i>", а не пустой строкой, как openpyxl/xlrd. Чтобы названия колонок
+                    # не зависели от движка, такой файл читаем следующим движком
+                    logger.info("В заголовке Excel есть ячейки из пробелов, читаем без calamine")
+                    df = None
+                    continue
+                logger.info(f"Excel файл прочитан с движком {engine}: {df.shape[0]} строк, {df.shape[1]} колонок")
+                break
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать с {engine}: {e}")
+        
+        if df is None:
+            # Последняя попытка - без указания движка
+            df = pd.read_excel(BytesIO(file_content))
+            logger.info(f"Excel файл прочитан без указания движка: {df.shape[0]} строк, {df.shape[1]} колонок")
         
         initial_rows = len(df)
         initial_cols = len(df.columns)
@@ -217,12 +297,12 @@ def parse_excel(file_content: bytes) -> Dict[str, Any]:
         after_empty_cols = len(df.columns)
         logger.info(f"Удалено пустых колонок: {initial_cols - after_empty_cols} (было: {initial_cols}, стало: {after_empty_cols})")
         
-        # Очищаем названия колонок от пробелов и лишних символов
-        df.columns = df.columns.str.strip()
-        
-        # Заменяем NaN в названиях колонок на "Unnamed"
-        df.columns = [f"Unnamed_{i}" if pd.isna(col) or str(col).strip() == '' else str(col).strip() 
-                      for i, col in enumerate(df.columns)]
+        # Очищаем названия колонок от пробелов и лишних символов и заменяем
+        # NaN и пустые названия на "Unnamed" (названия уже очищены, повторно не обрезаем)
+        stripped_columns = df.columns.str.strip()
+        empty_columns = stripped_columns.isna() | (stripped_columns == '')
+        df.columns = [f"Unnamed_{i}" if is_empty else col
+                      for i, (col, is_empty) in enumerate(zip(stripped_columns, empty_columns))]
         
         # Сбрасываем индекс после удаления строк
         df = df.reset_index(drop=True)
@@ -239,6 +319,47 @@ def parse_excel(file_content: bytes) -> Dict[str, Any]:
         raise ValueError(f"Не удалось распарсить Excel файл: {str(e)}")
 
 
+def to_python_value(value: Any) -> Any:
+    """Переводит скаляр NumPy в обычный тип Python (как to_dict в pandas)"""
+    # timedelta64 в NumPy - подкласс целых, поэтому даты проверяем первыми
+    if isinstance(value, np.datetime64):
+        return pd.Timestamp(value)
+    if isinstance(value, np.timedelta64):
+        return pd.Timedelta(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def column_to_list(column: pd.Series) -> List[Any]:
+    """
+    Значения колонки списком для хранения: NaN, NaT и пустые строки заменяются на None.
+    
+    Args:
+        column: Колонка DataFrame
+        
+    Returns:
+        Список значений в типах Python
+    """
+    values = column.to_numpy(dtype=object)
+    empty = pd.isna(values)
+    
+    if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'biufcmM':
+        # Числа, bool и даты: значения уже в типах Python, пропуски находим векторно
+        values[empty] = None
+        return values.tolist()
+    
+    # Текстовые и смешанные колонки: проверяем строки на пустоту и приводим скаляры NumPy
+    return [
+        None if is_empty or (isinstance(value, str) and value.strip() == '') else to_python_value(value)
+        for value, is_empty in zip(values, empty)
+    ]
+
+
 def dataframe_to_dict(df: pd.DataFrame) -> Dict[str, Any]:
     """
     Конвертирует DataFrame в словарь для хранения.
@@ -249,21 +370,14 @@ def dataframe_to_dict(df: pd.DataFrame) -> Dict[str, Any]:
     Returns:
         Словарь с данными таблицы
     """
-    # Заменяем NaN на None для JSON сериализации
-    df_clean = df.where(pd.notnull(df), None)
-    
-    # Конвертируем в список словарей
-    data = df_clean.to_dict('records')
-    
-    # Очищаем данные: заменяем NaN, NaT и пустые строки на None
-    for row in data:
-        for key, value in row.items():
-            if pd.isna(value) or (isinstance(value, str) and value.strip() == ''):
-                row[key] = None
-    
     # Получаем названия колонок
     columns = df.columns.tolist()
     
+    # Конвертируем в список словарей по колонкам (без to_dict и обхода каждой ячейки):
+    # NaN, NaT и пустые строки заменяются на None для JSON сериализации
+    column_values = [column_to_list(df.iloc[:, position]) for position in range(len(columns))]
+    data = [dict(zip(columns, row)) for row in zip(*column_values)]
+    
     # Получаем информацию о типах данных
     dtypes = {col: str(dtype) for col, dtype in df.dtypes.items()}
     
@@ -292,10 +406,72 @@ def dict_to_dataframe(table_dict: Dict[str, Any]) -> pd.DataFrame:
     if not data:
         return pd.DataFrame()
     
+    # В сохраненных таблицах все строки имеют одинаковые ключи. Если columns их покрывает,
+    # передаем колонки явно - pandas не собирает их объединением ключей всех строк.
+    # В широком формате из json_format_to_wide_format в columns нет patient_id и date,
+    # тогда колонки определяет pandas, как раньше
+    columns = list(dict.fromkeys(table_dict.get('columns') or []))
+    if columns and data[0].keys() <= set(columns):
+        return pd.DataFrame.from_records(data, columns=columns)
+    
     df = pd.DataFrame(data)
     return df
 
 
+def coerce_analysis_value(value: Any) -> Any:
+    """
+    Значение анализа для JSON формата: число, если преобразуется, иначе строка без пробелов.
+    
+    Args:
+        value: Значение ячейки
+        
+    Returns:
+        float, str или None (пустое значение - анализа нет)
+    """
+    if value is None or value == '':
+        return None
+    # Пытаемся преобразовать в число, но сохраняем и строки
+    try:
+        # Пробуем преобразовать в число
+        if isinstance(value, str):
+            # Убираем пробелы и пробуем преобразовать
+            value_clean = value.strip()
+            return float(value_clean) if value_clean else None
+        return float(value)
+    except (ValueError, TypeError):
+        # Если не число, все равно сохраняем как строку (для совместимости)
+        # Но только если это не пустая строка
+        return str(value).strip() or None
+
+
+def coerce_analysis_column(values: List[Any]) -> List[Any]:
+    """
+    Преобразует значения колонки анализа так же, как coerce_analysis_value для каждой ячейки.
+    
+    Числа (float) уже в нужном виде и не преобразуются повторно, а одинаковые строки
+    (например, "<0.5") преобразуются один раз на колонку - без повторных исключений
+    при разборе нечисловых значений.
+    
+    Args:
+        values: Значения колонки по строкам
+        
+    Returns:
+        Список значений (float, str или None) в том же порядке
+    """
+    result = []
+    converted_strings = {}
+    for value in values:
+        if type(value) is float:
+            result.append(value)
+        elif isinstance(value, str):
+            if value not in converted_strings:
+                converted_strings[value] = coerce_analysis_value(value)
+            result.append(converted_strings[value])
+        else:
+            result.append(coerce_analysis_value(value))
+    return result
+
+
 def wide_format_to_json_format(table_dict: Dict[str, Any]) -> Dict[str, Any]:
     """
     Конвертирует широкий формат таблицы в JSON формат для предобработки.
@@ -319,23 +495,24 @@ def wide_format_to_json_format(table_dict: Dict[str, Any]) -> Dict[str, Any]:
     logger.info(f"wide_format_to_json_format: входные данные - {len(data)} строк, {len(columns)} колонок")
     logger.debug(f"Колонки: {columns[:10]}...")
     
+    # Названия колонок в нижнем регистре - один раз для всех проверок ниже
+    lower_columns = [col.lower() for col in columns]
+    
     # Проверяем, может быть это уже длинный формат (test_name, value, patient_id)
-    long_format_indicators = ['test_name', 'test', 'analysis', 'анализ', 'value', 'значение']
-    is_long_format = any(col.lower() in long_format_indicators for col in columns)
+    is_long_format = not LONG_FORMAT_INDICATORS.isdisjoint(lower_columns)
     
     if is_long_format:
         logger.warning("Обнаружен длинный формат данных в wide_format_to_json_format! Это может быть ошибкой.")
-        logger.warning(f"Колонки содержат индикаторы длинного формата: {[col for col in columns if col.lower() in long_format_indicators]}")
+        logger.warning(f"Колонки содержат индикаторы длинного формата: {[col for col, col_lower in zip(columns, lower_columns) if col_lower in LONG_FORMAT_INDICATORS]}")
     
     # Ищем колонку с patient_id
     patient_id_col = None
     date_col = None
     
-    for col in columns:
-        col_lower = col.lower()
-        if col_lower in ['patient_id', 'id', 'patient id', 'пациент', 'subject_id', 'subject.subjectguid'] and not patient_id_col:
+    for col, col_lower in zip(columns, lower_columns):
+        if col_lower in PATIENT_ID_COLUMN_NAMES and not patient_id_col:
             patient_id_col = col
-        elif col_lower in ['date', 'дата'] and not date_col:
+        elif col_lower in DATE_COLUMN_NAMES and not date_col:
             date_col = col
     
     # Если не нашли patient_id, используем первую колонку или создаем индекс
@@ -356,57 +533,37 @@ def wide_format_to_json_format(table_dict: Dict[str, Any]) -> Dict[str, Any]:
     else:
         # Нормализуем test_names: сохраняем простой формат {test_code: "name"}
         # Для JSON формата используем простой формат {test_code: name}
-        normalized_test_names = {}
-        for test_code, name_data in test_names.items():
-            if isinstance(name_data, dict):
-                # Формат {name: "...", unit: "..."} - извлекаем только name
-                normalized_test_names[test_code] = name_data.get('name', test_code)
-            else:
-                # Простой формат: строка - сохраняем как есть
-                normalized_test_names[test_code] = name_data
-        test_names = normalized_test_names
+        test_names = normalize_test_names(test_names)
     
     # Преобразуем данные в формат patients
     patients = []
     skipped_empty = 0
     skipped_no_analyses = 0
     
-    for row_idx, row in enumerate(data):
-        patient_id = row.get(patient_id_col, '') if patient_id_col else ''
-        date = row.get(date_col, '') if date_col else ''
-        
-        # Пропускаем полностью пустые строки
-        if not patient_id and not any(row.get(col) for col in analysis_columns if row.get(col) is not None and row.get(col) != ''):
+    # Значения анализов преобразуем по колонкам (число или строка), а не по одной ячейке
+    analysis_values = [
+        coerce_analysis_column([row.get(test_code) for row in data])
+        for test_code in analysis_columns
+    ]
+    
+    # Значения анализов по строкам (если колонок анализов нет - пустые строки значений)
+    rows_values = zip(*analysis_values) if analysis_values else [()] * len(data)
+    
+    # patient_id и date тоже берем колонками, а не поиском по словарю в цикле по строкам
+    patient_ids = [row.get(patient_id_col, '') for row in data] if patient_id_col else [''] * len(data)
+    dates = [row.get(date_col, '') for row in data] if date_col else [''] * len(data)
+    
+    for row, patient_id, date, row_values in zip(data, patient_ids, dates, rows_values):
+        # Пропускаем полностью пустые строки (None и '' и так ложны, проверяем истинность значений)
+        if not patient_id and not any(map(row.get, analysis_columns)):
             skipped_empty += 1
             continue
         
-        analyses = {}
-        for test_code in analysis_columns:
-            value = row.get(test_code)
-            if value is not None and value != '':
-                # Пытаемся преобразовать в число, но сохраняем и строки
-                try:
-                    # Пробуем преобразовать в число
-                    if isinstance(value, str):
-                        # Убираем пробелы и пробуем преобразовать
-                        value_clean = value.strip()
-                        if value_clean:
-                            num_value = float(value_clean)
-                            analyses[test_code] = {
-                                'value': num_value
-                            }
-                    else:
-                        num_value = float(value)
-                        analyses[test_code] = {
-                            'value': num_value
-                        }
-                except (ValueError, TypeError):
-                    # Если не число, все равно сохраняем как строку (для совместимости)
-                    # Но только если это не пустая строка
-                    if str(value).strip():
-                        analyses[test_code] = {
-                            'value': str(value).strip()
-                        }
+        analyses = {
+            test_code: {'value': value}
+            for test_code, value in zip(analysis_columns, row_values)
+            if value is not None
+        }
         
         # Добавляем пациента даже если нет анализов (может быть только patient_id и date)
         # Но только если есть хотя бы patient_id
@@ -477,6 +634,8 @@ def json_format_to_wide_format(json_data: Dict[str, Any]) -> Dict[str, Any]:
         all_column_names.update(analyses.keys())
     # Добавляем все из test_names (на случай если у пациентов нет данных)
     all_column_names.update(test_names.keys())
+    # Сортируем один раз - порядок нужен и для columns, и для строк каждого пациента
+    sorted_column_names = sorted(all_column_names)
     
     # Создаем маппинг название_колонки -> название_из_excel для columns
     # ВАЖНО: В columns используем название из Excel для анализов, название из таблицы для метаданных
@@ -489,9 +648,20 @@ def json_format_to_wide_format(json_data: Dict[str, Any]) -> Dict[str, Any]:
             columns.append(meta_col)
             column_name_to_column_display[meta_col] = meta_col
     
+    # Колонки, которых нет в test_names, логируем одним сообщением, а не по одной в цикле
+    missing_test_names = [
+        col_name for col_name in sorted_column_names
+        if col_name not in ('patient_id', 'date') and test_names.get(col_name) is None
+    ]
+    if missing_test_names:
+        logger.warning(
+            f"json_format_to_wide_format: {len(missing_test_names)} колонок не найдено в test_names, "
+            f"используется test_code: {missing_test_names[:10]}"
+        )
+    
     # Теперь добавляем анализы - формат: "test_code_из_excel: название_из_excel"
     # ВАЖНО: Оба значения берутся из Excel через name_of_analysis.py
-    for col_name in sorted(all_column_names):
+    for col_name in sorted_column_names:
         # Пропускаем метаданные - они уже добавлены
         if col_name in ['patient_id', 'date']:
             continue
@@ -504,7 +674,6 @@ def json_format_to_wide_format(json_data: Dict[str, Any]) -> Dict[str, Any]:
         
         if excel_name is None:
             # Если не найдено в test_names, используем test_code как название
-            print(f"[file_parser] Предупреждение: колонка '{col_name}' не найдена в test_names, используется test_code")
             excel_name = test_code
         
         # Формат: "test_code_из_excel: название_из_excel"
@@ -518,6 +687,13 @@ def json_format_to_wide_format(json_data: Dict[str, Any]) -> Dict[str, Any]:
             # Сохраняем маппинг для преобразования данных
             column_name_to_column_display[col_name] = column_display_name
     
+    # Название колонки для отображения из маппинга - один раз на колонку, а не на каждого пациента
+    # Формат: "название_из_таблицы: название_из_excel" для анализов
+    display_columns = [
+        (col_name, column_name_to_column_display[col_name])
+        for col_name in sorted_column_names
+    ]
+    
     # Преобразуем пациентов в строки
     rows = []
     for patient in patients:
@@ -530,11 +706,7 @@ def json_format_to_wide_format(json_data: Dict[str, Any]) -> Dict[str, Any]:
             'date': date
         }
         
-        for col_name in sorted(all_column_names):
-            # Получаем название колонки для отображения из маппинга
-            # Формат: "название_из_таблицы: название_из_excel" для анализов
-            column_display_name = column_name_to_column_display[col_name]
-            
+        for col_name, column_display_name in display_columns:
             if col_name in analyses:
                 analysis = analyses[col_name]
                 # Извлекаем value из объекта анализа
@@ -550,30 +722,19 @@ def json_format_to_wide_format(json_data: Dict[str, Any]) -> Dict[str, Any]:
         
         rows.append(row)
     
-    # ВАЖНО: Убеждаемся, что columns - это простой список строк без индексов
-    # Преобразуем в список, если это не список
-    if not isinstance(columns, list):
-        columns = list(columns)
+    # ВАЖНО: Убеждаемся, что columns - это простой список строк без индексов:
+    # приводим к строкам, убираем пустые и дубликаты (с сохранением порядка) за один проход
+    stripped_columns = (str(col).strip() for col in columns if col)
+    columns = list(dict.fromkeys(col for col in stripped_columns if col))
     
-    # Убеждаемся, что все элементы - строки и убираем пустые
-    columns = [str(col).strip() for col in columns if col and str(col).strip()]
-    
-    # Убираем дубликаты, сохраняя порядок
-    seen = set()
-    columns_clean = []
-    for col in columns:
-        if col not in seen:
-            seen.add(col)
-            columns_clean.append(col)
-    columns = columns_clean
-    
-    # Создаем DataFrame для получения dtypes
-    df = pd.DataFrame(rows, columns=columns)
+    # Типы колонок определяем по каждой колонке отдельно (тот же вывод типов pandas),
+    # не собирая ради этого DataFrame из всей таблицы
+    dtypes = {col: str(pd.Series([row.get(col) for row in rows]).dtype) for col in columns}
     
     return {
         'data': rows,
         'columns': columns,  # Простой список строк, без индексов
-        'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
+        'dtypes': dtypes,
         'shape': {
             'rows': len(rows),
             'columns': len(columns)
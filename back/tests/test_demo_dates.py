@@ -0,0 +1,48 @@
+"""
+Тесты сравнения дат анализов (parse_date_keys и выбор последней записи).
+
+Запуск из каталога back: python -m unittest discover tests
+"""
+import unittest
+
+from app.routers.demo import get_abnormal_tests, parse_date_keys
+
+
+class ParseDateKeysTest(unittest.TestCase):
+    def test_mixed_offsets_compared_in_utc(self):
+        keys = parse_date_keys(['2024-01-02T00:00:00+03:00', '2024-01-02T00:00:00Z', '2024-01-02'])
+        # 00:00+03:00 - это 21:00 UTC предыдущего дня
+        self.assertLess(keys[0], keys[1])
+        self.assertEqual(keys[1], keys[2])
+
+    def test_offset_and_naive_dates(self):
+        keys = parse_date_keys(['2024-01-02T00:00:00+03:00', '2024-01-02'])
+        self.assertLess(keys[0], keys[1])
+
+    def test_dotted_dates_fall_back_to_string_compare(self):
+        keys = parse_date_keys(['02.01.2024', '03.01.2024', '', None])
+        self.assertLess(keys[0], keys[1])
+        self.assertEqual(keys[2], keys[3])
+        self.assertLess(keys[2], keys[0])
+
+    def test_empty_input(self):
+        self.assertEqual(parse_date_keys([]), [])
+
+
+class GetAbnormalTestsTest(unittest.TestCase):
+    def abnormal_row(self, date, value):
+        return {'test_code': 'chem.alt', 'test_name': 'ALT', 'value': value, 'unit': 'U/L', 'status': 'HIGH', 'date': date}
+
+    def test_latest_dotted_date_wins(self):
+        data = [self.abnormal_row('02.01.2024', 60), self.abnormal_row('03.01.2024', 70)]
+        result = get_abnormal_tests(data, {})
+        self.assertEqual([row['value'] for row in result], [70.0])
+
+    def test_latest_offset_date_wins(self):
+        data = [self.abnormal_row('2024-01-02T00:00:00Z', 60), self.abnormal_row('2024-01-02T00:00:00+03:00', 70)]
+        result = get_abnormal_tests(data, {})
+        self.assertEqual([row['value'] for row in result], [60.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
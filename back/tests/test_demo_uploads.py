@@ -0,0 +1,75 @@
+"""
+Тесты хранения загруженных данных пациентов по частям Parquet (манифест и его восстановление).
+
+Запуск из каталога back: python -m unittest discover tests
+"""
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+from app.routers import demo
+
+UPLOADED_COLUMNS = ['patient_id', 'test_code', 'test_name', 'value', 'unit', 'date', 'status']
+
+
+def uploaded_rows(*rows):
+    """DataFrame новых записей в том виде, в каком его собирает import_uploaded_file"""
+    df = pd.DataFrame(list(rows), columns=UPLOADED_COLUMNS)
+    return df.astype({col: 'string' for col in UPLOADED_COLUMNS if col != 'value'}).astype({'value': 'float64'})
+
+
+class UploadedPartsTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        data_dir = Path(temp_dir.name)
+        for name, path in {
+            'UPLOADED_DATA_FILE': data_dir / 'uploaded_data.csv',
+            'UPLOADED_PARQUET_FILE': data_dir / 'uploaded_data.parquet',
+            'UPLOADED_PARTS_DIR': data_dir / 'uploaded_data_parts',
+            'UPLOADED_MANIFEST_FILE': data_dir / 'uploaded_data.manifest',
+        }.items():
+            patcher = mock.patch.object(demo, name, path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        demo.save_uploaded_rows(uploaded_rows(('P1', 'a', 'A', 1.0, 'u', '2024-01-01', '')))
+        demo.save_uploaded_rows(uploaded_rows(('P2', 'b', 'B', 2.0, 'u', '2024-01-02', '')))
+
+    def stored_values(self):
+        df = demo.read_table_cached(demo.get_uploaded_data_file())
+        return dict(zip(df['patient_id'].astype(str), df['value']))
+
+    def test_appends_parts(self):
+        self.assertEqual(len(demo.load_uploaded_manifest()['parts']), 2)
+        self.assertEqual(self.stored_values(), {'P1': 1.0, 'P2': 2.0})
+
+    def test_corrupt_manifest_keeps_uploaded_data(self):
+        demo.UPLOADED_MANIFEST_FILE.write_bytes(b'not a pickle')
+        total = demo.save_uploaded_rows(uploaded_rows(('P3', 'c', 'C', 3.0, 'u', '2024-01-03', '')))
+        self.assertEqual(total, 3)
+        self.assertEqual(self.stored_values(), {'P1': 1.0, 'P2': 2.0, 'P3': 3.0})
+
+    def test_corrupt_manifest_with_replaced_key(self):
+        demo.UPLOADED_MANIFEST_FILE.write_bytes(b'\x80\x05garbage')
+        total = demo.save_uploaded_rows(uploaded_rows(('P1', 'a', 'A', 9.0, 'u', '2024-01-01', '')))
+        self.assertEqual(total, 2)
+        self.assertEqual(self.stored_values(), {'P1': 9.0, 'P2': 2.0})
+
+    def test_empty_manifest_is_rebuilt_on_read(self):
+        demo.UPLOADED_MANIFEST_FILE.write_bytes(b'')
+        self.assertIsNone(demo.load_uploaded_manifest())
+        self.assertEqual(self.stored_values(), {'P1': 1.0, 'P2': 2.0})
+        self.assertIsNotNone(demo.load_uploaded_manifest())
+
+    def test_missing_manifest_with_parts_is_rebuilt(self):
+        demo.UPLOADED_MANIFEST_FILE.unlink()
+        total = demo.save_uploaded_rows(uploaded_rows(('P3', 'c', 'C', 3.0, 'u', '2024-01-03', '')))
+        self.assertEqual(total, 3)
+        self.assertEqual(self.stored_values(), {'P1': 1.0, 'P2': 2.0, 'P3': 3.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
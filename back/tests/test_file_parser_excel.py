@@ -0,0 +1,51 @@
+"""
+Тесты названий колонок parse_excel для каждого движка чтения Excel.
+
+Запуск из каталога back: python -m unittest discover tests
+"""
+import unittest
+from io import BytesIO
+from unittest import mock
+
+import openpyxl
+
+from app.utils import file_parser
+
+
+def excel_bytes(header):
+    """xlsx с заданной строкой заголовка и одной строкой данных (чтобы колонки не считались пустыми)"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    sheet.append([1] * len(header))
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+# Заголовок -> ожидаемые колонки (как при чтении openpyxl до появления calamine)
+HEADER_CASES = [
+    ([' a ', None, '  ', 'c'], ['a', 'Unnamed: 1', 'Unnamed_2', 'c']),
+    (['x', 'Unnamed: 3', 'y'], ['x', 'Unnamed: 3', 'y']),
+    ([None, 'b', 'Unnamed: 2'], ['Unnamed: 0', 'b', 'Unnamed: 2']),
+    (['a', '   '], ['a', 'Unnamed_1']),
+]
+
+
+class ParseExcelColumnsTest(unittest.TestCase):
+    def check_columns(self, calamine_available):
+        with mock.patch.object(file_parser, 'CALAMINE_AVAILABLE', calamine_available):
+            for header, expected in HEADER_CASES:
+                with self.subTest(header=header):
+                    self.assertEqual(file_parser.parse_excel(excel_bytes(header))['columns'], expected)
+
+    def test_openpyxl_columns(self):
+        self.check_columns(calamine_available=False)
+
+    @unittest.skipUnless(file_parser.CALAMINE_AVAILABLE, "python-calamine не установлен")
+    def test_calamine_columns(self):
+        self.check_columns(calamine_available=True)
+
+
+if __name__ == '__main__':
+    unittest.main()